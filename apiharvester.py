@@ -8,11 +8,21 @@ import iso8601
 
 import json, pprint
 import logging
+import threading
+from io import BytesIO
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 from lxml import etree
 from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+import numpy as np
+
+from datastore import JsonLogStore
+import metrics
+from httpcache import ResponseCache
+from timezones import HOUR, epoch_seconds, format_utc, normalize_data
 
-# TODO: Check timezones in FMI harvesting
 
 def daterange(start_date, end_date):
     '''
@@ -35,6 +45,157 @@ def timerange(start_datetime, end_datetime, delta):
         current_datetime += delta
 
 
+def plan_windows(instants, max_span):
+    '''
+    Merge sorted datetimes greedily into the fewest possible (start, end) windows spanning at most max_span each.
+
+    >>> print plan_windows([datetime(2012, 2, 5, h) for h in [0, 1, 5, 9]], timedelta(hours=5))
+    [(datetime.datetime(2012, 2, 5, 0, 0), datetime.datetime(2012, 2, 5, 5, 0)), (datetime.datetime(2012, 2, 5, 9, 0), datetime.datetime(2012, 2, 5, 9, 0))]
+    '''
+    windows = []
+    for instant in instants:
+        if windows and instant - windows[-1][0] <= max_span:
+            windows[-1] = (windows[-1][0], instant)
+        else:
+            windows.append((instant, instant))
+    return windows
+
+
+BSWFS_NAMESPACE = '{http://xml.fmi.fi/schema/wfs/2.0}'
+BSWFS_ELEMENT = BSWFS_NAMESPACE + 'BsWfsElement'
+BSWFS_TIME = BSWFS_NAMESPACE + 'Time'
+BSWFS_PARAMETER_NAME = BSWFS_NAMESPACE + 'ParameterName'
+BSWFS_PARAMETER_VALUE = BSWFS_NAMESPACE + 'ParameterValue'
+
+
+def iter_wfs_values(source):
+    '''
+    Parse a FMI WFS simple feature response incrementally. Parsed elements are discarded as soon as they have been
+    read, so memory usage stays constant regardless of response size.
+
+    :param source: file-like object or filename of the XML response
+    :return: generator of (time, parameter name, parameter value) tuples
+    '''
+    for _, elem in etree.iterparse(source, events=('end',), tag=BSWFS_ELEMENT):
+        time = key = value = None
+        for child in elem:
+            if child.tag == BSWFS_TIME:
+                time = child.text
+            elif child.tag == BSWFS_PARAMETER_NAME:
+                key = child.text
+            elif child.tag == BSWFS_PARAMETER_VALUE:
+                value = child.text
+
+        yield time, key, value
+
+        # Drop the element and already handled siblings of its wfs:member parent
+        elem.clear()
+        member = elem.getparent()
+        if member is not None:
+            while member.getprevious() is not None:
+                del member.getparent()[0]
+
+
+class RateLimiter(object):
+    """
+    Token bucket rate limiter, safe for use from multiple threads
+    """
+
+    def __init__(self, rate, burst=1):
+        """
+        :param rate: allowed average rate in calls per second
+        :param burst: maximum number of calls allowed at once
+        """
+        self.rate = float(rate)
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until a token is available and consume it
+        """
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def concurrent_map(func, items, workers, limiter=None):
+    '''
+    Call func for each item using a pool of worker threads. Results are yielded as (item, result) tuples in
+    completion order. Failed calls are logged and yield None as result.
+
+    :param func: function taking a single item
+    :param items: iterable of items
+    :param workers: number of calls kept in flight
+    :param limiter: optional RateLimiter for the calls
+    '''
+    def call(item):
+        if limiter:
+            limiter.acquire()
+        try:
+            return item, func(item)
+        except Exception as e:
+            logging.error('Call failed for %s: %s' % (item, e))
+            return item, None
+
+    pool = ThreadPool(workers)
+    try:
+        for item_result in pool.imap_unordered(call, items):
+            yield item_result
+    finally:
+        pool.terminate()
+
+
+class CountingRetry(Retry):
+    """
+    Retry configuration counting retries in run metrics
+    """
+
+    def increment(self, *args, **kwargs):
+        metrics.increment('http_retries')
+        return super(CountingRetry, self).increment(*args, **kwargs)
+
+
+class TTLCache(object):
+    """
+    Thread safe in-memory cache whose entries expire after a fixed time
+    """
+
+    def __init__(self, ttl):
+        """
+        :param ttl: time to live of entries in seconds
+        """
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :return: cached value, or None if missing or expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self.entries[key]
+                return None
+            return entry[0]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.time() + self.ttl)
+
+
 class APIHarvester(object):
     """
     Harvester class for gathering data from FMI and HSL APIs
@@ -47,63 +208,159 @@ class APIHarvester(object):
     FMI_DATA_FILE = 'data/fmi.json'
     HSL_DATA_FILE = 'data/hsl.json'
 
-    FMI_FORECAST_PARAMS = {'request': 'getFeature', 'storedquery_id': 'fmi::forecast::hirlam::surface::point::simple', 'place': 'kaisaniemi,helsinki', 'timestep': 60}
+    FMI_PLACE = 'kaisaniemi,helsinki'  # Default weather station
+    FMI_FORECAST_PARAMS = {'request': 'getFeature', 'storedquery_id': 'fmi::forecast::hirlam::surface::point::simple', 'place': FMI_PLACE, 'timestep': 60}
     FMI_FORECAST_FIELDS = ['Temperature', 'WindSpeedMS', 'Precipitation1h']
 
-    FMI_HISTORY_PARAMS = {'request': 'getFeature', 'storedquery_id': 'fmi::observations::weather::simple', 'place': 'kaisaniemi,helsinki', 'timestep': 60}
+    FMI_HISTORY_PARAMS = {'request': 'getFeature', 'storedquery_id': 'fmi::observations::weather::simple', 'place': FMI_PLACE, 'timestep': 60}
     FMI_HISTORY_FIELDS = ['t2m', 'ws_10min', 'r_1h']
 
+    FMI_OBSERVATION_SPAN = timedelta(hours=67)  # Maximum end - start of a single observation query
+
     FMI_NAMESPACES = {'BsWfs': 'http://xml.fmi.fi/schema/wfs/2.0', 'wfs': "http://www.opengis.net/wfs/2.0"}
 
-    def __init__(self, loglevel=logging.INFO, logfile='../harvester.log', apikey=None ):
+    RETRY_STATUSES = [500, 502, 503, 504]
+
+    HTTP_CACHE_DIR = 'data/http_cache'
+    HISTORY_AGE = timedelta(days=1)  # API responses about times older than this are not expected to change
+    RECENT_TTL = 600  # Cache time for API responses about recent times in seconds
+    FORECAST_TTL = 3600  # Cache time for weather forecasts in seconds
+    STORE_BATCH = 100  # Amount of harvested HSL values stored at a time
+
+    def __init__(self, loglevel=logging.INFO, logfile='../harvester.log', apikey=None,
+                 pool_size=10, timeout=(5, 30), retries=3, backoff=0.5, store_class=JsonLogStore, hsl_cache_ttl=3600,
+                 cache_mode='record'):
+        """
+        :param pool_size: number of kept-alive connections per host
+        :param timeout: connect and read timeouts in seconds
+        :param retries: number of retries for failed requests
+        :param backoff: backoff factor for exponential delay between retries
+        :param store_class: DataStore subclass used for storing harvested data
+        :param hsl_cache_ttl: time in seconds to cache HSL API results in memory
+        :param cache_mode: mode of the on-disk API response cache, see httpcache.ResponseCache
+        """
         logging.basicConfig(filename=logfile, level=loglevel, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
         logging.info('Harvester initializing')
 
+        self.timeout = timeout
+        self.session = self._create_session(pool_size, retries, backoff)
+
+        self.fmi_store = store_class(self.FMI_DATA_FILE)
+        self.hsl_store = store_class(self.HSL_DATA_FILE)
+        self.hsl_cache = TTLCache(hsl_cache_ttl)
+        self.cache = ResponseCache(self.HTTP_CACHE_DIR, cache_mode)
+
         if apikey:
             self.fmi_apikey = apikey
         else:
             self.fmi_apikey = os.environ.get('fmi_apikey')
             if not self.fmi_apikey:
-                with open(os.environ.get('HOME') + '/fmi_apikey.txt', 'r') as f:
-                    self.fmi_apikey = f.read().replace('\n', '')
+                try:
+                    with open(os.environ.get('HOME') + '/fmi_apikey.txt', 'r') as f:
+                        self.fmi_apikey = f.read().replace('\n', '')
+                except IOError:
+                    # Cached responses can be replayed without an API key
+                    if cache_mode != 'replay':
+                        raise
+                    self.fmi_apikey = ''
 
         logging.info('Harvester initialized')
 
+    def _create_session(self, pool_size, retries, backoff):
+        """
+        Create a HTTP session with pooled keep-alive connections and retries with exponential backoff
+        """
+        retry = CountingRetry(total=retries, backoff_factor=backoff, status_forcelist=self.RETRY_STATUSES)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _get(self, url, params=None, ttl=None, cache_url=None):
+        """
+        Make a GET request using the response cache and the pooled session. New responses are not cached here, callers
+        cache them with _cache_response once they have been parsed and validated.
+
+        :param ttl: maximum age of a cached response in seconds, None if the response never changes
+        :param cache_url: URL identifying the request in the cache if differing from url, e.g. to leave out secrets
+        :return: response body
+        """
+        cache_url = cache_url or url
+
+        content = self.cache.get(cache_url, params, ttl)
+        if content is not None:
+            metrics.increment('http_cache_hits')
+            return content
+
+        metrics.increment('http_requests')
+        with metrics.span('http_get'):
+            result = self.session.get(url, params=params, timeout=self.timeout)
+        result.raise_for_status()
+
+        return result.content
+
+    def _cache_response(self, url, params, content, ttl=None):
+        """
+        Cache a validated response body. Bodies that are already cached are not stored again.
+
+        :param ttl: time in seconds after which the response can be pruned from the cache, None to keep it
+        """
+        self.cache.put(url, params, content, ttl)
+
+    def _history_ttl(self, when):
+        """
+        Response cache time for data about a given time. Data about the past is expected not to change.
+
+        :param when: datetime
+        """
+        now = datetime.now(when.tzinfo) if when.tzinfo else datetime.now()
+        return None if now - when > self.HISTORY_AGE else self.RECENT_TTL
+
     def read_datafile(self, filename):
         """
-        Read JSON data from a file if it exists
+        Read JSON data from a file if it exists, including updates logged by a JsonLogStore
 
         :param filename:
         :return:
         """
+        if not os.path.exists(filename) and not os.path.exists(filename + JsonLogStore.LOG_SUFFIX):
+            logging.error('Unable to read %s' % filename)
+            return None
+
         try:
-            with open(filename, 'r') as f:
-                data = json.load(f)
-                logging.info('Read %s data objects from %s' % (len(data), filename))
-                return data
+            return JsonLogStore(filename).read()
         except (ValueError, IOError):
             logging.error('Unable to read %s' % filename)
             return None
 
     def read_fmi_datafile(self):
-        with open(self.FMI_DATA_FILE, 'r') as f:
-            try:
-                data = json.load(f)
-                logging.info('Read %s FMI data objects' % len(data))
-                return data
-            except ValueError:
-                logging.error('Unable to read %s' % self.FMI_DATA_FILE)
-                return None
+        try:
+            with metrics.span('read_fmi_datafile'):
+                data = self.fmi_store.read()
+            logging.info('Read %s FMI data objects' % len(data))
+            return data
+        except ValueError:
+            logging.error('Unable to read %s' % self.FMI_DATA_FILE)
+            return None
 
     def read_hsl_datafile(self):
-        with open(self.HSL_DATA_FILE, 'r') as f:
-            try:
-                data = json.load(f)
-                logging.info('Read %s HSL data objects' % len(data))
-                return data
-            except ValueError:
-                logging.error('Unable to read %s' % self.HSL_DATA_FILE)
-                return None
+        try:
+            with metrics.span('read_hsl_datafile'):
+                data = self.hsl_store.read()
+            logging.info('Read %s HSL data objects' % len(data))
+            return data
+        except ValueError:
+            logging.error('Unable to read %s' % self.HSL_DATA_FILE)
+            return None
+
+    def checkpoint(self):
+        """
+        Compact harvested data to snapshot files
+        """
+        self.fmi_store.checkpoint()
+        self.hsl_store.checkpoint()
 
     def hsl_api(self, when):
         """
@@ -120,53 +377,104 @@ class APIHarvester(object):
 
         url = self.HSL_BASE + date_string
 
+        cached = self.hsl_cache.get(url)
+        if cached is not None:
+            metrics.increment('hsl_cache_hits')
+            return cached
+
         logging.info('Getting disruptions from %s' % url)
 
-        result = requests.get(url)
-        result_xml = result.text.encode('ascii', 'ignore')
-        result_etree = etree.fromstring(result_xml)
+        ttl = self._history_ttl(when)
+        with metrics.span('hsl_api'):
+            content = self._get(url, ttl=ttl)
+            result_etree = etree.fromstring(content)
 
         result_time = iso8601.parse_date(result_etree.get('time'))
 
         # Check that dates match since API returns current disruptions with invalid parameters
         assert result_time.date() == when_fin.date()
 
-        disruptions = result_etree.get('valid')
+        disruptions = int(result_etree.get('valid'))
+
+        self._cache_response(url, None, content, ttl)
 
         logging.info('Got %s disruptions' % disruptions)
 
-        return int(disruptions)
+        self.hsl_cache.set(url, disruptions)
+        return disruptions
 
-    def fmi_forecast(self, params=FMI_FORECAST_PARAMS):
+    def hsl_disruptions(self, instants, workers=4):
         """
-        Get weather forecast from FMI API
-        :rtype : dict
+        Get disruption info for multiple time instants from HSL API concurrently
+
+        :param instants: list of timezone aware datetimes
+        :param workers: number of concurrent API calls
+        :return: dict of {datetime: disruption amount}, failed calls are left out
+        """
+        return dict((instant, disruptions) for instant, disruptions in concurrent_map(self.hsl_api, instants, workers)
+                    if disruptions is not None)
+
+    def _fmi_query(self, params, fields, ttl=None):
+        """
+        Query FMI WFS API and collect the wanted fields
+
+        :param params: query parameters
+        :param fields: parameter names to collect
+        :param ttl: response cache time in seconds
+        :return: dict of {time: {field: value}}
         """
         url = self.FMI_BASE.format(apikey=self.fmi_apikey)
 
-        logging.info('Getting forecast from {url} with parameters {params}'.format(url=url, params=params))
+        logging.info('Getting weather data from {url} with parameters {params}'.format(url=url, params=params))
 
-        result = requests.get(url, params=params)
-        result_xml = result.text.encode('ascii', 'ignore')
-        result_etree = etree.fromstring(result_xml)
+        with metrics.span('fmi_query'):
+            content = self._get(url, params=params, ttl=ttl, cache_url=self.FMI_BASE)
+
+        values = defaultdict(dict)
+        elements = 0
+
+        with metrics.span('fmi_parse'):
+            for time, key, value in iter_wfs_values(BytesIO(content)):
+                elements += 1
+                if key in fields:
+                    logging.debug("%s - %s - %s" % (time, key, value))
+                    values[time].update({key: value})
+
+        if not elements:
+            # Not cached, so that missing data can be queried again later
+            logging.warning('No weather elements found from output: %s' % content)
+        else:
+            self._cache_response(self.FMI_BASE, params, content, ttl)
 
-        elements = result_etree.xpath('wfs:member/BsWfs:BsWfsElement', namespaces=self.FMI_NAMESPACES)
+        return values
 
-        forecasts = defaultdict(dict)
+    def fmi_forecast(self, params=FMI_FORECAST_PARAMS, place=None):
+        """
+        Get weather forecast from FMI API
+        :param place: weather station place name, defaults to the place in params
+        :rtype : dict
+        """
+        if place:
+            params = dict(params, place=place)
 
-        for elem in elements:
-            time = elem.xpath('BsWfs:Time', namespaces=self.FMI_NAMESPACES)[0].text
-            key = elem.xpath('BsWfs:ParameterName', namespaces=self.FMI_NAMESPACES)[0].text
-            value = elem.xpath('BsWfs:ParameterValue', namespaces=self.FMI_NAMESPACES)[0].text
-            if key in self.FMI_FORECAST_FIELDS:
-                # print "%s - %s - %s" % (time, key, value)
-                forecasts[time].update({key: value})
+        forecasts = self._fmi_query(params, self.FMI_FORECAST_FIELDS, ttl=self.FORECAST_TTL)
 
-        #pprint.pprint(forecasts)
         logging.info('Received weather forecasts for {num} time instants'.format(num=len(forecasts)))
 
         return forecasts
 
+    def fmi_forecasts(self, places, workers=4):
+        """
+        Get weather forecasts for multiple places from FMI API concurrently
+
+        :param places: list of weather station place names
+        :param workers: number of concurrent API calls
+        :return: dict of {place: forecasts}, failed calls are left out
+        """
+        return dict((place, forecasts) for place, forecasts in
+                    concurrent_map(lambda place: self.fmi_forecast(place=place), places, workers)
+                    if forecasts is not None)
+
     def fmi_observation(self, start_time, end_time, params=FMI_HISTORY_PARAMS):
         """
         Get weather observation data from FMI API. The API supports only short timespans (max 68h).
@@ -174,79 +482,108 @@ class APIHarvester(object):
         :param end_time: ending date & time string (ISO8601)
         :param params:
         """
-        url = self.FMI_BASE.format(apikey=self.fmi_apikey)
-
-        params.update({'starttime': start_time + 'Z', 'endtime': end_time + 'Z'})
-
-        logging.info('Getting weather observations from {url} with parameters {params}'.format(url=url, params=params))
-
-        result = requests.get(url, params=params)
-        result_xml = result.text.encode('ascii', 'ignore')
-        result_etree = etree.fromstring(result_xml)
+        params = dict(params, starttime=start_time + 'Z', endtime=end_time + 'Z')
 
-        elements = result_etree.xpath('wfs:member/BsWfs:BsWfsElement', namespaces=self.FMI_NAMESPACES)
-
-        observations = defaultdict(dict)
-
-        if not len(elements):
-            logging.warning('No weather elements found from output: %s' % result_xml)
-
-        for elem in elements:
-            time = elem.xpath('BsWfs:Time', namespaces=self.FMI_NAMESPACES)[0].text
-            key = elem.xpath('BsWfs:ParameterName', namespaces=self.FMI_NAMESPACES)[0].text
-            value = elem.xpath('BsWfs:ParameterValue', namespaces=self.FMI_NAMESPACES)[0].text
-            if key in self.FMI_HISTORY_FIELDS:
-                logging.debug("%s - %s - %s" % (time, key, value))
-                observations[time].update({key: value})
+        ttl = self._history_ttl(iso8601.parse_date(end_time))
+        observations = self._fmi_query(params, self.FMI_HISTORY_FIELDS, ttl=ttl)
 
         logging.info('Received weather observations for {num} time instants'.format(num=len(observations)))
 
         return observations
 
     def test_hsl(self):
-        assert self.hsl_api(datetime(2010, 9, 17, 9, 0)) == 2
-        assert self.hsl_api(datetime(2011, 9, 17, 9, 0)) == 4
-        assert self.hsl_api(datetime(2015, 1, 29, 15, 15)) == 0
+        """
+        Check HSL API results for known dates. Runs offline using an APIHarvester with cache_mode='replay' once the
+        responses have been recorded.
+        """
+        helsinki = tz.gettz('Europe/Helsinki')
+        assert self.hsl_api(datetime(2010, 9, 17, 9, 0, tzinfo=helsinki)) == 2
+        assert self.hsl_api(datetime(2011, 9, 17, 9, 0, tzinfo=helsinki)) == 4
+        assert self.hsl_api(datetime(2015, 1, 29, 15, 15, tzinfo=helsinki)) == 0
         print 'HSL OK'
 
-    def harvest_hsl(self, harvest_start, harvest_end, delay=0.5):
+    def harvest_hsl(self, harvest_start, harvest_end, delay=0.5, workers=1):
         """
-        Harvest HSL data and save it to json file. Safe for use by a single process at a time.
+        Harvest HSL data and save it to the HSL data store with UTC timestamps. Safe for use by a single process at a
+        time.
+
+        With multiple workers the API calls are made concurrently, keeping at most `workers` requests in flight
+        while limiting the average request rate to one per `delay` seconds.
 
-        :param harvest_start: date or datetime
-        :param harvest_end: date or datetime
+        :param harvest_start: date or datetime, first date to harvest in Finnish time
+        :param harvest_end: date or datetime, date to stop at in Finnish time
         :param delay: delay between API calls in seconds
+        :param workers: number of concurrent API calls
         """
         data_hsl = self.read_hsl_datafile()
 
-        for single_date in daterange(harvest_start, harvest_end):
-            for hour in range(0, 24):
-                instant = datetime(single_date.year, single_date.month, single_date.day, hour)
-                datestr = instant.isoformat()
-                if data_hsl.get(datestr) is None:
-                    data_hsl.update({datestr: self.hsl_api(instant)})
-                    time.sleep(delay)
+        local_dates = [datetime(day.year, day.month, day.day).isoformat() for day in (harvest_start, harvest_end)]
+        start, end = epoch_seconds(local_dates, 'Europe/Helsinki')
+
+        instants = [iso8601.parse_date(timestamp) for timestamp in format_utc(np.arange(start, end, HOUR))
+                    if data_hsl.get(timestamp) is None]
+
+        new_data = {}
 
-        with open(self.HSL_DATA_FILE, 'w') as f:
-            logging.info('Dumping %s objects of HSL data to %s' % (len(data_hsl), self.HSL_DATA_FILE))
-            json.dump(data_hsl, f)
+        def store(force=False):
+            if new_data and (force or len(new_data) >= self.STORE_BATCH):
+                logging.info('Storing %s objects of HSL data to %s' % (len(new_data), self.HSL_DATA_FILE))
+                self.hsl_store.upsert(new_data)
+                new_data.clear()
 
-    def harvest_fmi(self, harvest_start, harvest_end):
+        if workers > 1:
+            limiter = RateLimiter(1.0 / delay, burst=workers) if delay else None
+            logging.info('Harvesting %s HSL instants with %s workers' % (len(instants), workers))
+            for instant, disruptions in concurrent_map(self.hsl_api, instants, workers, limiter):
+                if disruptions is not None:
+                    new_data.update({instant.isoformat(): disruptions})
+                    store()
+        else:
+            for instant in instants:
+                new_data.update({instant.isoformat(): self.hsl_api(instant)})
+                store()
+                time.sleep(delay)
+
+        store(force=True)
+
+    def missing_fmi_hours(self, harvest_start, harvest_end):
         """
-        Harvest FMI data and save it to json file.
-        :param harvest_start: datetime
-        :param harvest_end: datetime
+        Find the hours missing from the FMI data store by scanning it once.
+
+        :param harvest_start: datetime (UTC)
+        :param harvest_end: datetime (UTC)
+        :return: sorted list of naive UTC datetimes
         """
         data_fmi = self.read_fmi_datafile()
 
-        if not all([t.isoformat() in data_fmi for t in
-                    timerange(harvest_start, harvest_end, timedelta(hours=1))]):
-            data_fmi.update(self.fmi_observation(harvest_start.isoformat(), harvest_end.isoformat()))
-        else:
+        start, end = epoch_seconds([harvest_start.isoformat(), harvest_end.isoformat()])
+        hours = np.arange(start, end, HOUR)
+        missing = hours[~np.in1d(hours, epoch_seconds(data_fmi))]
+
+        return [datetime.utcfromtimestamp(seconds) for seconds in missing.tolist()]
+
+    def harvest_fmi(self, harvest_start, harvest_end, workers=1):
+        """
+        Harvest FMI data and save it to the FMI data store with UTC timestamps. Missing hours are fetched using as few
+        API queries as possible, each covering up to FMI_OBSERVATION_SPAN.
+
+        :param harvest_start: datetime (UTC)
+        :param harvest_end: datetime (UTC)
+        :param workers: number of concurrent API calls
+        """
+        windows = plan_windows(self.missing_fmi_hours(harvest_start, harvest_end), self.FMI_OBSERVATION_SPAN)
+
+        if not windows:
             logging.info('Time range beginning from %s already harvested' % (harvest_start))
+            return
+
+        logging.info('Harvesting FMI data in %s queries' % len(windows))
 
-        with open(self.FMI_DATA_FILE, 'w') as f:
-            logging.info('Dumping %s objects of FMI data to %s' % (len(data_fmi), self.FMI_DATA_FILE))
-            json.dump(data_fmi, f)
+        def observe(window):
+            return self.fmi_observation(window[0].isoformat(), window[1].isoformat())
 
+        for window, observations in concurrent_map(observe, windows, workers):
+            if observations is not None:
+                logging.info('Storing %s objects of FMI data to %s' % (len(observations), self.FMI_DATA_FILE))
+                self.fmi_store.upsert(normalize_data(observations))
 
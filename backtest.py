@@ -0,0 +1,228 @@
+"""Rolling-origin backtesting of prediction models against observed disruptions
+
+Each model is evaluated at a series of forecast origins: it is trained with all data before the origin and tested with
+the data of the following period, like it would have been used in production. Folds are evaluated in a process pool
+whose workers share the cached feature store memory-mapped.
+
+Stored predictions of the models can also be scored against observed disruptions collected by store_predictions.py.
+"""
+
+import argparse
+import copy
+import json
+import logging
+import os
+import numpy as np
+
+from datastore import JsonLogStore
+from features import FeatureStore
+from timeindex import TimeIndex
+from timezones import HOUR, DAY, format_utc
+import models
+import workers
+
+FEATURE_DIR = 'data/features'
+OBSERVED_DISRUPTIONS_FILE = 'data/disruptions_observed.json'
+
+def _worker_features():
+    '''
+    Feature store of a worker process, loaded memory-mapped on first use
+
+    :return: (FeatureStore, hours since the epoch)
+    '''
+    if 'features' not in workers.state:
+        features = FeatureStore.load(workers.state['feature_dir'])
+        workers.state.update(features=features, hours=features.times.astype(np.int64))
+    return workers.state['features'], workers.state['hours']
+
+
+def _evaluate(task):
+    '''
+    Train a copy of the model with data before the origin and test it with data of the following period
+
+    :param task: (model, origin hour, end hour)
+    :return: (model name, origin hour, error metrics or None if there is no test data)
+    '''
+    model, origin, end = task
+    features, hours = _worker_features()
+
+    # Times are sorted, so training and test data are contiguous slices
+    origin_row, end_row = np.searchsorted(hours, [origin, end])
+    if origin_row == end_row:
+        return model.name, origin, None
+
+    x, y = features.x(model.parameters), features.y()
+
+    model = copy.copy(model)
+    model.generate_model(x[:origin_row], y[:origin_row])
+    return model.name, origin, error_metrics(model.predict_batch(x[origin_row:end_row]), y[origin_row:end_row])
+
+
+def error_metrics(predicted, observed):
+    '''
+    :return: dict of count, mean absolute error, root mean squared error, mean error (bias) and share of exactly
+             correct predictions
+    '''
+    errors = np.asarray(predicted, dtype=float) - np.asarray(observed, dtype=float)
+    if not len(errors):
+        return {'count': 0}
+
+    return {'count': len(errors),
+            'mae': float(np.abs(errors).mean()),
+            'rmse': float(np.sqrt((errors ** 2).mean())),
+            'bias': float(errors.mean()),
+            'accuracy': float((errors == 0).mean())}
+
+
+def rolling_origins(hours, step, min_train):
+    '''
+    Forecast origins every step hours, starting after min_train hours of data
+
+    :param hours: sorted array of hours since the epoch
+    :return: list of (origin hour, end hour)
+    '''
+    if not len(hours):
+        return []
+
+    origins = np.arange(hours[0] + min_train, hours[-1] + 1, step)
+    return [(int(origin), int(origin + step)) for origin in origins]
+
+
+def saved_params(prediction_models):
+    '''
+    Take training parameters of models that have none in init_models() from their saved models, like those of
+    Optimized Forest found by generate_models.py -o. Models that are not generated yet are left out.
+
+    :return: list of models to backtest
+    '''
+    usable = []
+    for model in prediction_models:
+        if isinstance(model, models.ScikitPredictor) and not model.model_kwargs:
+            model.load_estimator()
+            if model.model is None:
+                logging.warning('Leaving out model %s without parameters, generate it first' % model.name)
+                continue
+            params = model.model.get_params()
+            params.pop('n_jobs', None)
+            model.model_kwargs = params
+            model.model = None  # Tasks pass only the parameters to workers
+        usable.append(model)
+    return usable
+
+
+def backtest(prediction_models, feature_dir=FEATURE_DIR, step=30 * DAY // HOUR, min_train=365 * DAY // HOUR,
+             processes=None):
+    '''
+    Run a rolling-origin backtest for models
+
+    :param prediction_models: list of PredictionModel
+    :param feature_dir: directory of a saved FeatureStore
+    :param step: hours between origins, and length of test periods
+    :param min_train: hours of data before the first origin
+    :param processes: amount of worker processes, defaults to CPU count
+    :return: dict of {model name: list of error metrics of each period with its origin, sorted by origin}
+    '''
+    prediction_models = saved_params(prediction_models)
+
+    features = FeatureStore.load(feature_dir)
+    origins = rolling_origins(features.times.astype(np.int64), step, min_train)
+
+    # Latest origins have the most training data, start them first to keep workers busy until the end
+    tasks = [(model, origin, end) for origin, end in reversed(origins) for model in prediction_models]
+    logging.info('Backtesting %s models at %s origins' % (len(prediction_models), len(origins)))
+
+    results = dict((model.name, []) for model in prediction_models)
+
+    pool = workers.pool(processes, feature_dir=feature_dir)
+    try:
+        for name, origin, scores in pool.imap_unordered(_evaluate, tasks):
+            if scores is not None:
+                results[name].append(dict(scores, origin=format_utc([origin * HOUR])[0]))
+    finally:
+        pool.close()
+        pool.join()
+
+    for periods in results.itervalues():
+        periods.sort(key=lambda period: period['origin'])
+    return results
+
+
+def summarize(periods):
+    '''
+    Combine error metrics of periods, weighting by amount of test data
+
+    :rtype : dict
+    '''
+    counts = np.array([period['count'] for period in periods], dtype=float)
+    if not counts.sum():
+        return {'count': 0}
+
+    summary = {'count': int(counts.sum())}
+    for key in ['mae', 'bias', 'accuracy']:
+        summary[key] = float(np.dot(counts, [period[key] for period in periods]) / counts.sum())
+    summary['rmse'] = float(np.sqrt(np.dot(counts, [period['rmse'] ** 2 for period in periods]) / counts.sum()))
+    return summary
+
+
+def score_stored_predictions(prediction_models, observed_file=OBSERVED_DISRUPTIONS_FILE):
+    '''
+    Score predictions stored by store_predictions.py against observed disruptions
+
+    :return: dict of {model name: error metrics}
+    '''
+    observed = JsonLogStore(observed_file).read()
+    observed_index = TimeIndex(observed)
+
+    scores = {}
+    for model in prediction_models:
+        predictions = JsonLogStore(model.JSON_FILE).read()
+        prediction_index = TimeIndex(predictions)
+        _, prediction_positions, observed_positions = prediction_index.intersect(observed_index)
+
+        predicted = [predictions[timestamp] for timestamp in prediction_index.keys[prediction_positions]]
+        scores[model.name] = error_metrics(predicted, [observed[timestamp]
+                                                       for timestamp in observed_index.keys[observed_positions]])
+    return scores
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backtest prediction models')
+    parser.add_argument('-m', '--model', help='Model to backtest, may be given multiple times. Defaults to all models',
+                        dest='models', action='append', choices=[model.name for model in models.prediction_models])
+    parser.add_argument('-j', help='Number of processes, defaults to CPU count', dest='processes', type=int)
+    parser.add_argument('--features', help='Directory of cached features saved by generate_models.py',
+                        default=FEATURE_DIR)
+    parser.add_argument('--step', help='Days between forecast origins', type=int, default=30)
+    parser.add_argument('--min-train', help='Days of training data before the first origin', dest='min_train',
+                        type=int, default=365)
+    parser.add_argument('--stored', help='Score stored predictions against observed disruptions instead',
+                        action='store_true')
+    parser.add_argument('-o', help='Write results as JSON to this file', dest='output')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    selected = [model for model in models.init_models() if not args.models or model.name in args.models]
+
+    if args.stored:
+        results = score_stored_predictions(selected)
+        summaries = results
+    else:
+        if not os.path.exists(args.features):
+            parser.exit(message='No cached features in %s, run generate_models.py first\n' % args.features)
+
+        results = backtest(selected, args.features, args.step * DAY // HOUR, args.min_train * DAY // HOUR,
+                           args.processes)
+        summaries = dict((name, summarize(periods)) for name, periods in results.iteritems())
+
+    for model in selected:
+        summary = summaries.get(model.name, {'count': 0})
+        if summary['count']:
+            print '%-20s MAE %.3f  RMSE %.3f  bias %+.3f  accuracy %.3f  (%s hours)' % \
+                  (model.name, summary['mae'], summary['rmse'], summary['bias'], summary['accuracy'], summary['count'])
+        else:
+            print '%-20s no data' % model.name
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
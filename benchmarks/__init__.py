@@ -0,0 +1 @@
+"""Performance benchmarks run with synthetic data"""
@@ -0,0 +1,100 @@
+"""Synthetic API responses and data files for benchmarks"""
+
+from datetime import datetime, timedelta
+import random
+
+WFS_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n' \
+             '<wfs:FeatureCollection timeStamp="2015-01-29T12:00:00Z" numberMatched="{num}" numberReturned="{num}" ' \
+             'xmlns:wfs="http://www.opengis.net/wfs/2.0" xmlns:gml="http://www.opengis.net/gml/3.2" ' \
+             'xmlns:BsWfs="http://xml.fmi.fi/schema/wfs/2.0">\n'
+
+WFS_MEMBER = '''    <wfs:member>
+        <BsWfs:BsWfsElement gml:id="BsWfsElement.1.{index}.1">
+            <BsWfs:Location>
+                <gml:Point gml:id="BsWfsElementP.1.{index}.1" srsDimension="2" srsName="http://www.opengis.net/def/crs/EPSG/0/4258">
+                    <gml:pos>60.17523 24.94459 </gml:pos>
+                </gml:Point>
+            </BsWfs:Location>
+            <BsWfs:Time>{time}</BsWfs:Time>
+            <BsWfs:ParameterName>{name}</BsWfs:ParameterName>
+            <BsWfs:ParameterValue>{value}</BsWfs:ParameterValue>
+        </BsWfs:BsWfsElement>
+    </wfs:member>
+'''
+
+WFS_FOOTER = '</wfs:FeatureCollection>\n'
+
+OBSERVATION_FIELDS = ['t2m', 'ws_10min', 'r_1h', 'rh', 'td', 'p_sea']
+FORECAST_FIELDS = ['Temperature', 'WindSpeedMS', 'Precipitation1h', 'Humidity', 'Pressure']
+
+
+def hours(start, amount):
+    """
+    Generate hourly datetimes
+    """
+    for n in range(amount):
+        yield start + timedelta(hours=n)
+
+
+def weather_values(rnd):
+    """
+    Random but plausible weather values in observation field order
+    """
+    return [round(rnd.gauss(5, 10), 1), round(abs(rnd.gauss(4, 3)), 1), round(max(rnd.gauss(-0.5, 1), -1.0), 1),
+            round(rnd.uniform(30, 100), 0), round(rnd.gauss(0, 8), 1), round(rnd.gauss(1010, 10), 1)]
+
+
+def wfs_response(fields, start=datetime(2014, 1, 1), amount=68, seed=1):
+    """
+    Generate a FMI WFS simple feature response with one element per field and hour
+
+    :param fields: parameter names
+    :param start: first hour (UTC)
+    :param amount: number of hours
+    :rtype : str
+    """
+    rnd = random.Random(seed)
+    members = []
+    index = 0
+    for instant in hours(start, amount):
+        time = instant.isoformat() + 'Z'
+        for name, value in zip(fields, weather_values(rnd)):
+            index += 1
+            members.append(WFS_MEMBER.format(index=index, time=time, name=name, value=value))
+
+    return WFS_HEADER.format(num=len(members)) + ''.join(members) + WFS_FOOTER
+
+
+def hourly_data(start=datetime(2010, 1, 1), amount=24 * 365, seed=1):
+    """
+    Generate FMI observation and HSL disruption data like in the harvested data files. Disruptions increase with
+    rain, wind and cold, and some hours have missing values.
+
+    :param start: first hour (UTC)
+    :param amount: number of hours
+    :return: (dict of {timestamp: {FMI field: value}}, dict of {timestamp: disruption amount})
+    """
+    rnd = random.Random(seed)
+    fmi_data = {}
+    hsl_data = {}
+    for instant in hours(start, amount):
+        timestamp = instant.isoformat() + '+00:00'
+        temperature, wind, rain = weather_values(rnd)[:3]
+        fmi_data[timestamp] = {'t2m': str(temperature), 'ws_10min': str(wind),
+                               'r_1h': 'NaN' if rnd.random() < 0.01 else str(rain)}
+        if rnd.random() < 0.95:
+            rate = 1 + max(rain, 0) * 2 + wind / 4 + max(-temperature, 0) / 10 + (instant.hour in (7, 8, 16, 17))
+            hsl_data[timestamp] = int(rnd.expovariate(1.0 / rate))
+
+    return fmi_data, hsl_data
+
+
+def hsl_response(when, disruptions=3):
+    """
+    Generate a HSL disruption API response
+
+    :param when: timezone aware datetime in Helsinki time
+    :rtype : str
+    """
+    return '<?xml version="1.0" encoding="UTF-8"?>\n' \
+           '<DISRUPTIONS time="{time}" valid="{valid}"></DISRUPTIONS>\n'.format(time=when.isoformat(), valid=disruptions)
@@ -0,0 +1,58 @@
+"""Compare compiled random forest inference with scikit-learn RandomForestClassifier.predict
+
+Run from the project root: python -m benchmarks.forest_inference
+"""
+
+import timeit
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from benchmarks.fixtures import hourly_data
+from features import FeatureStore
+from forest import CompiledForest
+
+FORESTS = [
+    ('Simple Forest', dict(n_estimators=50)),
+    ('Optimized Forest', dict(max_features=2, n_estimators=38, criterion='gini', max_depth=10)),
+]
+
+
+def check_equivalence(forest, compiled, x):
+    '''
+    Raise AssertionError unless compiled predictions are identical to scikit-learn predictions
+    '''
+    assert np.array_equal(forest.predict_proba(x), compiled.predict_proba(x))
+    assert np.array_equal(forest.predict(x), compiled.predict(x))
+
+
+def run(repeat=5, number=20):
+    """
+    :return: dict of {forest name: {batch size: {implementation: best time per prediction call in seconds}}}
+    """
+    features = FeatureStore.from_data(*hourly_data(amount=24 * 365 * 2))
+    x, y = features.x(6), features.y()
+    rnd = np.random.RandomState(0)
+
+    results = {}
+    for name, kwargs in FORESTS:
+        forest = RandomForestClassifier(random_state=0, **kwargs).fit(x, y)
+        compiled = CompiledForest.from_forest(forest)
+        check_equivalence(forest, compiled, x)
+
+        results[name] = {}
+        for size in [1, 24, 24 * 30]:
+            batch = x[rnd.randint(len(x), size=size)]
+            results[name][size] = {}
+            for implementation, func in [('sklearn', forest.predict), ('compiled', compiled.predict)]:
+                timer = timeit.Timer(lambda: func(batch))
+                results[name][size][implementation] = min(timer.repeat(repeat, number=number)) / number
+
+    return results
+
+
+if __name__ == '__main__':
+    for name, sizes in sorted(run().items()):
+        for size, times in sorted(sizes.items()):
+            print '%-16s %4s rows: sklearn %.5f s, compiled %.5f s (%.1fx)' % \
+                  (name, size, times['sklearn'], times['compiled'], times['sklearn'] / times['compiled'])
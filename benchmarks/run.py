@@ -0,0 +1,184 @@
+"""Benchmark suite for the harvesting, preprocessing, training and prediction hot paths
+
+All data is synthetic and generated locally, and data and model files are written to a temporary directory. Results
+are written as JSON, and can be compared with the results of an earlier run to find regressions:
+
+    python -m benchmarks.run -o results.json
+    python -m benchmarks.run --compare results.json
+
+Run from the project root.
+"""
+
+import argparse
+from datetime import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+from dateutil import tz
+import numpy as np
+
+from apiharvester import APIHarvester
+from benchmarks.fixtures import wfs_response, hsl_response, hourly_data, OBSERVATION_FIELDS, FORECAST_FIELDS
+from datastore import JsonLogStore
+from features import FeatureStore
+import models
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def best_time(func, repeat, number=1):
+    '''
+    :return: best time of a single call in seconds
+    '''
+    return min(timeit.Timer(func).repeat(repeat, number=number)) / number
+
+
+def create_harvester(directory):
+    '''
+    APIHarvester without network access, response cache or HSL result cache, using data files in directory
+    '''
+    harvester = APIHarvester(loglevel=logging.WARNING, logfile=os.path.join(directory, 'harvester.log'),
+                             apikey='benchmark', cache_mode='off', hsl_cache_ttl=-1)
+    harvester.fmi_store = JsonLogStore(os.path.join(directory, harvester.FMI_DATA_FILE))
+    harvester.hsl_store = JsonLogStore(os.path.join(directory, harvester.HSL_DATA_FILE))
+    return harvester
+
+
+def bench_harvest(directory, repeat):
+    harvester = create_harvester(directory)
+    results = {}
+
+    observations = wfs_response(OBSERVATION_FIELDS, amount=68).encode('utf-8')
+    harvester._get = lambda url, params=None, ttl=None, cache_url=None: observations
+    results['fmi_observation 68h'] = best_time(
+        lambda: harvester.fmi_observation('2014-01-01T00:00:00', '2014-01-03T19:00:00'), repeat)
+
+    forecasts = wfs_response(FORECAST_FIELDS, start=datetime(2015, 1, 29, 12), amount=54).encode('utf-8')
+    harvester._get = lambda url, params=None, ttl=None, cache_url=None: forecasts
+    results['fmi_forecast 54h'] = best_time(harvester.fmi_forecast, repeat)
+
+    when = datetime(2014, 1, 1, 12, tzinfo=tz.tzutc())
+    disruptions = hsl_response(when.astimezone(tz.gettz('Europe/Helsinki')))
+    harvester._get = lambda url, params=None, ttl=None, cache_url=None: disruptions
+    results['hsl_api'] = best_time(lambda: harvester.hsl_api(when), repeat, number=100)
+
+    return results
+
+
+def bench_preprocess(directory, repeat, fmi_data, hsl_data):
+    harvester = create_harvester(directory)
+    results = {}
+
+    for store, data in [(harvester.fmi_store, fmi_data), (harvester.hsl_store, hsl_data)]:
+        store.replace(data)
+        store.checkpoint()
+
+    results['read datafiles'] = best_time(lambda: (create_harvester(directory).read_fmi_datafile(),
+                                                   create_harvester(directory).read_hsl_datafile()), repeat)
+    results['preprocess'] = best_time(lambda: FeatureStore.from_data(fmi_data, hsl_data), repeat)
+    return results
+
+
+def in_directory(model, directory):
+    if hasattr(model, 'filename'):
+        model.filename = os.path.join(directory, model.filename)
+    return model
+
+
+def bench_models(directory, repeat, features):
+    results = {}
+    x, y = features.x(6), features.y()
+    batch = x[-24:]
+    row = x[-1:]
+
+    for index, model in enumerate(models.init_models()):
+        model = in_directory(model, directory)
+        results['train %s' % model.name] = best_time(lambda: model.generate_model(x[:, :model.parameters], y),
+                                                     min(repeat, 3))
+        model.save_model()
+
+        loaded = in_directory(models.init_models()[index], directory)
+        results['load %s' % model.name] = best_time(loaded.load_model, repeat)
+
+        loaded.predict_batch(batch)  # Warm up lazily built structures
+        results['predict 1 row %s' % model.name] = best_time(lambda: loaded.predict_batch(row), repeat, number=20)
+        results['predict 24 rows %s' % model.name] = best_time(lambda: loaded.predict_batch(batch), repeat, number=20)
+
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=PROJECT_DIR,
+                                       stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(repeat=5, years=4):
+    """
+    Run all benchmarks in a temporary directory
+
+    :param years: amount of years of hourly data for preprocessing and training
+    :return: dict of {benchmark name: best time in seconds}
+    """
+    fmi_data, hsl_data = hourly_data(amount=int(24 * 365.25 * years))
+    features = FeatureStore.from_data(fmi_data, hsl_data)
+
+    directory = tempfile.mkdtemp(prefix='benchmarks')
+    try:
+        for subdirectory in ['data', 'model']:
+            os.mkdir(os.path.join(directory, subdirectory))
+
+        results = {}
+        results.update(bench_harvest(directory, repeat))
+        results.update(bench_preprocess(directory, repeat, fmi_data, hsl_data))
+        results.update(bench_models(directory, repeat, features))
+        return results
+    finally:
+        shutil.rmtree(directory)
+
+
+def compare(results, baseline, threshold):
+    '''
+    :return: list of (benchmark name, baseline time, time) of benchmarks slower than baseline by more than threshold
+    '''
+    return [(name, baseline[name], results[name]) for name in sorted(results)
+            if name in baseline and results[name] > baseline[name] * (1 + threshold)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run benchmarks')
+    parser.add_argument('-o', help='Write results as JSON to this file instead of standard output', dest='output')
+    parser.add_argument('--repeat', help='Number of timing repeats, best time is reported', type=int, default=5)
+    parser.add_argument('--years', help='Years of synthetic hourly data', type=int, default=4)
+    parser.add_argument('--compare', help='Report regressions against results in this JSON file', dest='baseline')
+    parser.add_argument('--threshold', help='Relative slowdown reported as regression', type=float, default=0.2)
+    args = parser.parse_args()
+
+    report = {'commit': git_commit(), 'time': datetime.utcnow().isoformat() + 'Z', 'python': platform.python_version(),
+              'numpy': np.__version__, 'repeat': args.repeat, 'years': args.years,
+              'results': run(args.repeat, args.years)}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        print json.dumps(report, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+        regressions = compare(report['results'], baseline['results'], args.threshold)
+        for name, before, after in regressions:
+            print >> sys.stderr, 'Regression in %s: %.5f s -> %.5f s' % (name, before, after)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,54 @@
+"""Measure start-up time of the prediction command line tool
+
+Run from the project root: python -m benchmarks.startup
+"""
+
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ['numpy', 'sklearn', 'scipy']
+
+COMMANDS = [
+    ('import models', [sys.executable, '-c', 'import models']),
+    ('predict.py 0-model', [sys.executable, 'predict.py', '-m', '0-model', '5', '0', '3', '12']),
+    ('predict.py 3NN', [sys.executable, 'predict.py', '-m', '3NN', '5', '0', '3', '12']),
+    ('predict.py 4-value models', [sys.executable, 'predict.py', '5', '0', '3', '12']),
+    ('predict.py all models', [sys.executable, 'predict.py', '5', '0', '3', '12', '3', '10']),
+]
+
+
+def time_command(command, repeat):
+    '''
+    :return: best wall clock time of running the command in seconds
+    '''
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        returncode = subprocess.call(command, stdout=open('/dev/null', 'w'), stderr=subprocess.STDOUT)
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, ' '.join(command))
+        times.append(time.time() - start)
+    return min(times)
+
+
+def heavy_imports():
+    '''
+    :return: list of heavy modules imported by importing models
+    '''
+    script = 'import sys, models; print " ".join(m for m in %r if m in sys.modules)' % HEAVY_MODULES
+    return subprocess.check_output([sys.executable, '-c', script]).split()
+
+
+def run(repeat=5):
+    """
+    :return: dict of {command name: best time in seconds}
+    """
+    return dict((name, time_command(command, repeat)) for name, command in COMMANDS)
+
+
+if __name__ == '__main__':
+    print 'Heavy modules imported by models: %s' % (', '.join(heavy_imports()) or 'none')
+    results = run()
+    for name, _ in COMMANDS:
+        print '%-24s %.3f s' % (name, results[name])
@@ -0,0 +1,63 @@
+"""Compare streaming FMI WFS parsing with the per-element XPath parsing it replaced
+
+Run from the project root: python -m benchmarks.wfs_parsing
+"""
+
+from collections import defaultdict
+from io import BytesIO
+import timeit
+
+from lxml import etree
+
+from apiharvester import APIHarvester, iter_wfs_values
+from benchmarks.fixtures import wfs_response, OBSERVATION_FIELDS
+
+
+def parse_xpath(content, fields):
+    """
+    Previous implementation: decode and re-encode the response, build a full tree and run three XPath queries per
+    element.
+    """
+    namespaces = APIHarvester.FMI_NAMESPACES
+    result_etree = etree.fromstring(content.decode('utf-8').encode('ascii', 'ignore'))
+    values = defaultdict(dict)
+    for elem in result_etree.xpath('wfs:member/BsWfs:BsWfsElement', namespaces=namespaces):
+        time = elem.xpath('BsWfs:Time', namespaces=namespaces)[0].text
+        key = elem.xpath('BsWfs:ParameterName', namespaces=namespaces)[0].text
+        value = elem.xpath('BsWfs:ParameterValue', namespaces=namespaces)[0].text
+        if key in fields:
+            values[time].update({key: value})
+    return values
+
+
+def parse_streaming(content, fields):
+    values = defaultdict(dict)
+    for time, key, value in iter_wfs_values(BytesIO(content)):
+        if key in fields:
+            values[time].update({key: value})
+    return values
+
+
+def run(repeat=5):
+    """
+    :return: dict of {hours: {implementation: best time in seconds}}
+    """
+    results = {}
+    fields = APIHarvester.FMI_HISTORY_FIELDS
+
+    for amount in [24, 68, 68 * 10]:
+        content = wfs_response(OBSERVATION_FIELDS, amount=amount).encode('utf-8')
+        assert parse_xpath(content, fields) == parse_streaming(content, fields)
+
+        results[amount] = {}
+        for name, func in [('xpath', parse_xpath), ('streaming', parse_streaming)]:
+            timer = timeit.Timer(lambda: func(content, fields))
+            results[amount][name] = min(timer.repeat(repeat, number=1))
+
+    return results
+
+
+if __name__ == '__main__':
+    for amount, times in sorted(run().items()):
+        print '%4s hours: xpath %.4f s, streaming %.4f s (%.1fx)' % \
+              (amount, times['xpath'], times['streaming'], times['xpath'] / times['streaming'])
@@ -0,0 +1,181 @@
+"""Storage backends for harvested data"""
+
+import json
+import logging
+import os
+
+import metrics
+
+
+class DataStore(object):
+    """
+    Data store skeleton. Stores a dict of JSON serializable values keyed by timestamp strings.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def read(self):
+        """
+        Read all stored data. The returned dict must not be modified, use upsert() instead.
+
+        :rtype : dict
+        """
+        return {}
+
+    def upsert(self, data):
+        """
+        Insert new or update existing values
+
+        :param data: dict of updated values
+        """
+        pass
+
+    def replace(self, data):
+        """
+        Replace all stored data
+
+        :param data: dict of values
+        """
+        pass
+
+    def checkpoint(self):
+        """
+        Persist all stored data to a consistent state on disk
+        """
+        pass
+
+
+class JsonLogStore(DataStore):
+    """
+    JSON snapshot file with an append-only JSON lines log of updates.
+
+    Updates are appended to the log, so their cost is proportional to the amount of new data. Reading replays the log
+    over the snapshot. At checkpoints the log is compacted into a new snapshot which is atomically renamed over the old
+    one. A crash can only lose the update being written when it happened: readers ignore a last log line without its
+    terminating newline, and the next update cuts it off before appending, so completed updates are never lost.
+    """
+
+    LOG_SUFFIX = '.log'
+
+    def __init__(self, filename, compact_ratio=0.5, compact_min=10000):
+        """
+        :param filename: snapshot JSON file
+        :param compact_ratio: compact the log when it has more entries than this ratio of stored entries
+        :param compact_min: minimum amount of log entries before compacting
+        """
+        super(JsonLogStore, self).__init__(filename)
+        self.log_filename = filename + self.LOG_SUFFIX
+        self.compact_ratio = compact_ratio
+        self.compact_min = compact_min
+        self.data = None
+        self.log_entries = 0
+        self.log_checked = False  # Whether a partially written last log line has been cut off
+
+    def _load(self):
+        with metrics.span('json_load'):
+            return self._load_files()
+
+    def _load_files(self):
+        data = {}
+        if os.path.exists(self.filename):
+            with open(self.filename, 'r') as f:
+                data = json.load(f)
+
+        self.log_entries = 0
+        if os.path.exists(self.log_filename):
+            with open(self.log_filename, 'r') as f:
+                for line in f:
+                    # A last line without a newline is still being written or was cut off by a crash, even if it
+                    # happens to be valid JSON
+                    if not line.endswith('\n'):
+                        logging.warning('Ignoring unterminated last log line in %s' % self.log_filename)
+                        break
+                    try:
+                        update = json.loads(line)
+                    except ValueError:
+                        logging.warning('Skipping broken log line in %s' % self.log_filename)
+                        continue
+                    data.update(update)
+                    self.log_entries += len(update)
+
+        logging.info('Read %s data objects from %s (%s log entries)' % (len(data), self.filename, self.log_entries))
+        return data
+
+    def read(self):
+        if self.data is None:
+            self.data = self._load()
+        return self.data
+
+    def upsert(self, data):
+        if not data:
+            return
+
+        self.read()
+
+        if not self.log_checked:
+            self._cut_partial_line()
+            self.log_checked = True
+
+        with metrics.span('json_append'), open(self.log_filename, 'a') as f:
+            f.write(json.dumps(data) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.data.update(data)
+        self.log_entries += len(data)
+
+        if self.log_entries > max(self.compact_min, self.compact_ratio * len(self.data)):
+            self.checkpoint()
+
+    def _cut_partial_line(self, chunk_size=4096):
+        '''
+        Cut off a last log line left partially written by a crash, so that new updates start on a fresh line
+        '''
+        if not os.path.exists(self.log_filename):
+            return
+
+        with open(self.log_filename, 'r+') as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            if not end:
+                return
+            f.seek(end - 1)
+            if f.read(1) == '\n':
+                return
+
+            # Search backwards for the end of the last complete line
+            position = end
+            while position > 0:
+                start = max(0, position - chunk_size)
+                f.seek(start)
+                newline = f.read(position - start).rfind('\n')
+                if newline >= 0:
+                    position = start + newline + 1
+                    break
+                position = start
+
+            logging.warning('Cutting off partially written log line in %s' % self.log_filename)
+            f.truncate(position)
+
+    def replace(self, data):
+        self.data = dict(data)
+        self.checkpoint()
+
+    def checkpoint(self):
+        if self.data is None:
+            return
+
+        logging.info('Writing snapshot of %s data objects to %s' % (len(self.data), self.filename))
+
+        temp_filename = self.filename + '.tmp'
+        with metrics.span('json_dump'), open(temp_filename, 'w') as f:
+            json.dump(self.data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(temp_filename, self.filename)
+
+        # Replaying an already compacted log is harmless, so a crash before truncating loses nothing
+        with open(self.log_filename, 'w'):
+            pass
+        self.log_entries = 0
@@ -0,0 +1,163 @@
+"""Columnar feature store for weather and disruption data"""
+
+import logging
+import os
+
+import numpy as np
+
+from timeindex import TimeIndex, epoch_hours
+
+FMI_FIELDS = ['r_1h', 't2m', 'ws_10min']
+FORECAST_FIELDS = ['Precipitation1h', 'Temperature', 'WindSpeedMS']
+
+# Feature matrix column order, models use the first `parameters` columns
+FEATURES = ['precipitation', 'temperature', 'wind_speed', 'hour', 'weekday', 'month']
+
+# Years of training data. 2013 is skipped as it has a public transportation strike, and other years are test data.
+TRAINING_YEARS = ['2010', '2011', '2012', '2014']
+
+# Held-out test years, never trained incrementally. Hours harvested after the training years are trainable.
+TEST_YEARS = ['2013']
+
+# 2013 strikes, removed from test data
+STRIKE_DATES = ['2013-04-03', '2013-05-14', '2013-05-15', '2013-05-16', '2013-05-17', '2013-05-18', '2013-05-19',
+                '2013-05-20', '2013-11-08']
+
+
+def time_features(times):
+    '''
+    Calculate hour, ISO weekday and month columns from hourly datetime64 values
+
+    :rtype : numpy.ndarray
+    '''
+    hours = times.astype('datetime64[h]').astype(np.int64)
+    days = times.astype('datetime64[D]').astype(np.int64)
+    months = times.astype('datetime64[M]').astype(np.int64)
+
+    # 1970-01-01 was a Thursday
+    return np.column_stack((hours % 24, (days + 3) % 7 + 1, months % 12 + 1))
+
+
+def forecast_features(forecasts):
+    '''
+    Format FMI weather forecasts to a feature matrix with all FEATURES
+
+    :param forecasts: dict of {timestamp: {forecast field: value}}
+    :return: (sorted list of timestamps, feature matrix)
+    '''
+    timestamps = sorted(forecasts)
+
+    weather = np.array([[forecasts[timestamp][field] for field in FORECAST_FIELDS] for timestamp in timestamps],
+                       dtype=float).reshape(-1, len(FORECAST_FIELDS))
+
+    return timestamps, np.hstack((weather, time_features(epoch_hours(timestamps).astype('datetime64[h]'))))
+
+
+class FeatureStore(object):
+    """
+    Joined weather and disruption data as typed columns, sorted by time (UTC).
+
+    The feature matrix holds all features in FEATURES order, so feature matrices for models using fewer parameters are
+    column slices sharing the same memory. Stores can be saved as .npy files and loaded memory-mapped.
+    """
+
+    FILES = ['times', 'features', 'disruptions']
+
+    def __init__(self, times, features, disruptions):
+        """
+        :param times: datetime64[h] array of observation times
+        :param features: float array of shape (len(times), len(FEATURES))
+        :param disruptions: int array of disruption amounts
+        """
+        self.times = times
+        self.features = features
+        self.disruptions = disruptions
+
+    def __len__(self):
+        return len(self.times)
+
+    @classmethod
+    def from_data(cls, fmi_data, hsl_data):
+        '''
+        Join FMI and HSL data by hour. Rows with missing weather values or non-numeric disruption amounts are
+        skipped.
+
+        :param fmi_data: dict of {timestamp: {FMI field: value}}
+        :param hsl_data: dict of {timestamp: disruption amount}
+        :rtype : FeatureStore
+        '''
+        fmi_index = TimeIndex(fmi_data)
+        hsl_index = TimeIndex(hsl_data)
+        hours, fmi_positions, hsl_positions = fmi_index.intersect(hsl_index)
+
+        weather = np.array([[fmi_data[timestamp].get(field, 'nan') for field in FMI_FIELDS]
+                            for timestamp in fmi_index.keys[fmi_positions]], dtype=float).reshape(-1, len(FMI_FIELDS))
+        disruptions = np.array([str(hsl_data[timestamp]) for timestamp in hsl_index.keys[hsl_positions]], dtype=str)
+
+        valid = ~np.isnan(weather).any(axis=1) & np.char.isdigit(disruptions)
+        if (~valid).any():
+            logging.info('Skipping %s rows with missing values' % (~valid).sum())
+
+        weather = weather[valid]
+        weather[weather[:, 0] == -1.0, 0] = 0  # Assuming "-1.0" rainfall means zero rain
+
+        times = hours[valid].astype('datetime64[h]')
+        features = np.hstack((weather, time_features(times)))
+
+        return cls(times, features, disruptions[valid].astype(int))
+
+    def x(self, parameters):
+        '''
+        Feature matrix for a model using the given amount of parameters
+
+        :rtype : numpy.ndarray
+        '''
+        return self.features[:, :parameters]
+
+    def y(self):
+        return self.disruptions
+
+    def select(self, mask):
+        '''
+        Select rows with a boolean mask or index array
+
+        :rtype : FeatureStore
+        '''
+        return FeatureStore(self.times[mask], self.features[mask], self.disruptions[mask])
+
+    def split(self, *masks):
+        '''
+        Split rows into several stores with boolean masks. Selected rows are copied once into a single reordered
+        array, and the returned stores are contiguous views of it.
+
+        :return: list of FeatureStore, one for each mask
+        '''
+        positions = [np.flatnonzero(mask) for mask in masks]
+        order = np.concatenate(positions)
+        times, features, disruptions = self.times[order], self.features[order], self.disruptions[order]
+
+        stores = []
+        start = 0
+        for selected in positions:
+            end = start + len(selected)
+            stores.append(FeatureStore(times[start:end], features[start:end], disruptions[start:end]))
+            start = end
+        return stores
+
+    def save(self, directory):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        for name in self.FILES:
+            np.save(os.path.join(directory, name + '.npy'), getattr(self, name))
+
+        logging.info('Saved %s rows of features to %s' % (len(self), directory))
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        '''
+        Load a saved feature store, memory-mapped by default
+
+        :rtype : FeatureStore
+        '''
+        return cls(*[np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode) for name in cls.FILES])
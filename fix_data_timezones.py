@@ -1,15 +1,21 @@
-"""Fix timezones to UTC in data files"""
+"""Fix timezones to UTC in data files
 
-from datetime import timedelta, datetime
-import json
-import arrow
-from dateutil import tz
+The harvester stores data with UTC timestamps, so this is needed only for data files harvested before that.
+"""
+
+import argparse
+from datetime import datetime
 import shutil
 
-import iso8601
-import pytz
+from dateutil import tz
 
 from apiharvester import APIHarvester
+from timezones import normalize_data
+
+parser = argparse.ArgumentParser(description='Convert data file timestamps to UTC')
+parser.add_argument('-b', help='Make backup copies of the data files first',
+                    dest='backup', action='store_const', const=True, default=False)
+args = parser.parse_args()
 
 harvester = APIHarvester()
 
@@ -19,44 +25,22 @@ hsl_data = harvester.read_hsl_datafile()
 print 'FMI data length: %s' % (len(fmi_data))
 print 'HSL data length: %s' % (len(hsl_data))
 
-helsinki = tz.gettz('Europe/Helsinki')
-utc = tz.gettz('UTC')
-now = datetime.now(helsinki)
-
-print 'Making backups'
-shutil.copyfile(harvester.FMI_DATA_FILE, harvester.FMI_DATA_FILE + "." + now.isoformat())
-shutil.copyfile(harvester.HSL_DATA_FILE, harvester.HSL_DATA_FILE + "." + now.isoformat())
+if args.backup:
+    now = datetime.now(tz.gettz('Europe/Helsinki'))
 
-new_hsl = {}
-new_fmi = {}
+    print 'Making backups'
+    harvester.checkpoint()
+    shutil.copyfile(harvester.FMI_DATA_FILE, harvester.FMI_DATA_FILE + "." + now.isoformat())
+    shutil.copyfile(harvester.HSL_DATA_FILE, harvester.HSL_DATA_FILE + "." + now.isoformat())
 
-for timestamp, value in hsl_data.iteritems():
-    time = iso8601.parse_date(timestamp, default_timezone=helsinki)
-    new_time = time.astimezone(utc)
-    new_timestamp = new_time.isoformat()
-
-    new_hsl.update({new_timestamp: value})
+# HSL data was harvested with Finnish times, FMI data with UTC times
+new_hsl = normalize_data(hsl_data, 'Europe/Helsinki')
+new_fmi = normalize_data(fmi_data, 'UTC')
 
 print 'Saving new HSL data file'
 print 'Length: %s' % (len(new_hsl))
-print 'Format: %s --> %s' % (timestamp, new_timestamp)
-with open(harvester.HSL_DATA_FILE, 'w') as f:
-    json.dump(new_hsl, f)
-
-for timestamp, value in fmi_data.iteritems():
-    time = iso8601.parse_date(timestamp, default_timezone=utc)
-    new_time = time.astimezone(utc)
-    new_timestamp = new_time.isoformat()
-
-    new_fmi.update({new_timestamp: value})
-
-    if timestamp == new_timestamp:
-        print time
-        print new_time.isoformat()
-        break
+harvester.hsl_store.replace(new_hsl)
 
 print 'Saving new FMI data file'
 print 'Length: %s' % (len(new_fmi))
-print 'Format: %s --> %s' % (timestamp, new_timestamp)
-with open(harvester.FMI_DATA_FILE, 'w') as f:
-    json.dump(new_fmi, f)
+harvester.fmi_store.replace(new_fmi)
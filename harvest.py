@@ -1,6 +1,15 @@
-from datetime import datetime, timedelta, date
-from apiharvester import APIHarvester, daterange
+import argparse
+from datetime import datetime, date
+from apiharvester import APIHarvester
 from predictor import *
+import metrics
+
+parser = argparse.ArgumentParser(description='Harvest weather and disruption data')
+metrics.add_argument(parser)
+args = parser.parse_args()
+
+if args.metrics:
+    metrics.enable()
 
 #################################
 
@@ -11,10 +20,17 @@ harvester = APIHarvester()
 #harvester.fmi_forecast()
 #pprint.pprint(harvester.fmi_observation(datetime(2010, 9, 17, 9, 0).isoformat(), datetime(2010, 9, 17, 18, 0).isoformat()))
 
-for single_date in daterange(date(2010, 1, 1), date(2012, 12, 31)):
-    harvester.harvest_fmi(datetime(single_date.year, single_date.month, single_date.day, 0, 0, 0),
-                          datetime(single_date.year, single_date.month, single_date.day, 23, 59, 59))
-    harvester.harvest_hsl(single_date, single_date + timedelta(days=1))
+HSL_WORKERS = 8
+FMI_WORKERS = 4
+
+harvester.harvest_fmi(datetime(2010, 1, 1), datetime(2012, 12, 31), workers=FMI_WORKERS)
+
+harvester.harvest_hsl(date(2010, 1, 1), date(2012, 12, 31), workers=HSL_WORKERS)
+
+harvester.checkpoint()
+
+if args.metrics:
+    metrics.write(args.metrics)
 
 #year = 2010
 #for day in [7, 11]:
@@ -0,0 +1,155 @@
+"""Persistent on-disk cache for HTTP responses"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+
+
+class CacheMiss(Exception):
+    """Response is not cached and the cache is in replay mode"""
+    pass
+
+
+class ResponseCache(object):
+    """
+    Content-addressed cache of HTTP response bodies.
+
+    Bodies are stored zlib compressed in files named by the SHA-1 hash of their content, so identical responses are
+    stored once. An append-only JSON lines index maps requests (URL and parameters) to body hashes, storing times and
+    expiry times. In record mode the index is compacted on load once it has enough superseded or expired entries, and
+    bodies no longer referenced are deleted.
+
+    Modes:
+        record  Use cached responses and cache new ones
+        replay  Use only cached responses, raising CacheMiss for others. Works without network access.
+        off     Don't use the cache
+    """
+
+    MODES = ['record', 'replay', 'off']
+    INDEX_FILE = 'index.jsonl'
+    COMPACT_MIN = 1000  # Minimum amount of obsolete index entries before compacting
+
+    def __init__(self, directory, mode='record'):
+        if mode not in self.MODES:
+            raise ValueError('Unknown cache mode %s' % mode)
+
+        self.directory = directory
+        self.mode = mode
+        self.index_filename = os.path.join(directory, self.INDEX_FILE)
+        self.index = {}  # {request key: (digest, storing time, expiry time or None)}
+        self.lock = threading.Lock()
+
+        if mode != 'off' and os.path.exists(self.index_filename):
+            lines = 0
+            with open(self.index_filename, 'r') as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.index[entry['key']] = (entry['digest'], entry['time'], entry.get('expires'))
+            logging.info('Read %s cached responses from %s' % (len(self.index), directory))
+
+            if mode == 'record':
+                now = time.time()
+                live = sum(1 for entry in self.index.itervalues() if entry[2] is None or entry[2] > now)
+                if lines - live > max(self.COMPACT_MIN, live):
+                    self.compact()
+
+    @staticmethod
+    def request_key(url, params=None):
+        return json.dumps([url, sorted((params or {}).items())])
+
+    def _blob_filename(self, digest):
+        return os.path.join(self.directory, digest[:2], digest[2:])
+
+    def get(self, url, params=None, ttl=None):
+        '''
+        Get a cached response body
+
+        :param url: request URL
+        :param params: request parameters
+        :param ttl: maximum age of the response in seconds, None for responses that never expire
+        :return: response body, or None if not cached or expired
+        '''
+        if self.mode == 'off':
+            return None
+
+        entry = self.index.get(self.request_key(url, params))
+
+        if entry is None or (ttl is not None and self.mode != 'replay' and entry[1] + ttl < time.time()):
+            if self.mode == 'replay':
+                raise CacheMiss('No cached response for %s %s' % (url, params))
+            return None
+
+        with open(self._blob_filename(entry[0]), 'rb') as f:
+            return zlib.decompress(f.read())
+
+    def put(self, url, params, content, ttl=None):
+        '''
+        Cache a response body. Storing a body that is already cached and not expired for the request does nothing.
+
+        :param url: request URL
+        :param params: request parameters
+        :param content: response body
+        :param ttl: time in seconds after which the response can be pruned, None to keep it
+        '''
+        if self.mode != 'record':
+            return
+
+        key = self.request_key(url, params)
+        digest = hashlib.sha1(content).hexdigest()
+        filename = self._blob_filename(digest)
+
+        with self.lock:
+            now = time.time()
+            entry = self.index.get(key)
+            if entry is not None and entry[0] == digest and (ttl is None or entry[1] + ttl >= now):
+                return
+
+            if not os.path.exists(filename):
+                if not os.path.exists(os.path.dirname(filename)):
+                    os.makedirs(os.path.dirname(filename))
+                temp_filename = filename + '.tmp'
+                with open(temp_filename, 'wb') as f:
+                    f.write(zlib.compress(content))
+                os.rename(temp_filename, filename)
+
+            expires = now + ttl if ttl is not None else None
+            with open(self.index_filename, 'a') as f:
+                f.write(json.dumps({'key': key, 'digest': digest, 'time': now, 'expires': expires}) + '\n')
+            self.index[key] = (digest, now, expires)
+
+    def compact(self):
+        '''
+        Rewrite the index with only the latest unexpired entry of each request, and delete bodies no longer referenced
+        '''
+        with self.lock:
+            now = time.time()
+            self.index = dict((key, entry) for key, entry in self.index.iteritems()
+                              if entry[2] is None or entry[2] > now)
+
+            temp_filename = self.index_filename + '.tmp'
+            with open(temp_filename, 'w') as f:
+                for key, (digest, stored, expires) in self.index.iteritems():
+                    f.write(json.dumps({'key': key, 'digest': digest, 'time': stored, 'expires': expires}) + '\n')
+            os.rename(temp_filename, self.index_filename)
+
+            referenced = set(entry[0] for entry in self.index.itervalues())
+            removed = 0
+            for prefix in os.listdir(self.directory):
+                subdirectory = os.path.join(self.directory, prefix)
+                if len(prefix) != 2 or not os.path.isdir(subdirectory):
+                    continue
+                for name in os.listdir(subdirectory):
+                    if prefix + name not in referenced:
+                        os.remove(os.path.join(subdirectory, name))
+                        removed += 1
+
+            logging.info('Compacted response cache %s to %s responses, removed %s bodies'
+                         % (self.directory, len(self.index), removed))
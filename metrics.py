@@ -0,0 +1,160 @@
+"""Lightweight run metrics: timing spans and counters, exported as JSON or Prometheus text
+
+Metrics are collected in a process-wide registry and are disabled by default, in which case spans and counters cost a
+single attribute check. Usage:
+
+    import metrics
+
+    metrics.enable()
+    with metrics.span('hsl_api'):
+        ...
+    metrics.increment('http_requests')
+    metrics.write('run.prom')
+"""
+
+import json
+import os
+import threading
+import time
+
+
+class _NullSpan(object):
+    """Span used while metrics are disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _Span(object):
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.record(self.name, time.time() - self.start)
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Metrics(object):
+    """
+    Registry of timing spans and counters, safe for use from multiple threads
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.spans = {}  # {name: [count, total seconds, max seconds]}
+        self.counters = {}  # {name: value}
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self.spans = {}
+            self.counters = {}
+            self.started = time.time()
+
+    def span(self, name):
+        '''
+        Context manager timing a block of code
+        '''
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def record(self, name, seconds):
+        with self.lock:
+            stats = self.spans.get(name)
+            if stats is None:
+                self.spans[name] = [1, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] = max(stats[2], seconds)
+
+    def increment(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def summary(self):
+        '''
+        :return: dict of run duration, spans and counters
+        '''
+        with self.lock:
+            return {'duration': time.time() - self.started,
+                    'spans': dict((name, {'count': count, 'seconds': total, 'max_seconds': longest})
+                                  for name, (count, total, longest) in self.spans.iteritems()),
+                    'counters': dict(self.counters)}
+
+    def prometheus(self, prefix='disruptions'):
+        '''
+        Format metrics in the Prometheus text exposition format
+
+        :rtype : str
+        '''
+        summary = self.summary()
+        lines = ['# TYPE %s_run_duration_seconds gauge' % prefix,
+                 '%s_run_duration_seconds %f' % (prefix, summary['duration'])]
+
+        for metric, key, kind in [('span_count', 'count', 'counter'), ('span_seconds', 'seconds', 'counter'),
+                                  ('span_max_seconds', 'max_seconds', 'gauge')]:
+            lines.append('# TYPE %s_%s %s' % (prefix, metric, kind))
+            for name, stats in sorted(summary['spans'].iteritems()):
+                lines.append('%s_%s{span="%s"} %s' % (prefix, metric, name, repr(stats[key])))
+
+        for name, value in sorted(summary['counters'].iteritems()):
+            lines.append('# TYPE %s_%s_total counter' % (prefix, name))
+            lines.append('%s_%s_total %s' % (prefix, name, value))
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename):
+        '''
+        Write metrics to a file, in Prometheus text format if the file name ends with .prom and as JSON otherwise
+        '''
+        if filename.endswith('.prom'):
+            content = self.prometheus()
+        else:
+            content = json.dumps(self.summary(), indent=2, sort_keys=True)
+
+        temp_filename = filename + '.tmp'
+        with open(temp_filename, 'w') as f:
+            f.write(content)
+        os.rename(temp_filename, filename)
+
+
+registry = Metrics()
+
+span = registry.span
+increment = registry.increment
+write = registry.write
+
+
+def add_argument(parser):
+    '''
+    Add a --metrics option for the metrics file to an argparse parser
+    '''
+    parser.add_argument('--metrics', help='Write run metrics to this file, in Prometheus text format if the name ends '
+                                          'with .prom and as JSON otherwise')
+
+
+def enable():
+    registry.reset()
+    registry.enabled = True
+
+
+def disable():
+    registry.enabled = False
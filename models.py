@@ -1,9 +1,36 @@
 """Prediction models for traffic disruption prediction based on weather forecast"""
 
+import metrics
+
+# Last trained hour of incrementally trainable models, see update_models.py
+ONLINE_STATE_FILE = 'model/online_state.json'
+
+
+def _load_file(load, filename, attempts=3):
+    '''
+    Load a saved model file. Saving a model removes the array files of earlier saves, so a load racing with a save
+    may miss them, and is then retried with the new file.
+
+    :param load: function loading the file
+    :return: loaded object, or None if the file does not exist
+    '''
+    import os
+
+    for attempt in range(attempts):
+        if not os.path.exists(filename):
+            return None
+        try:
+            return load(filename)
+        except IOError:
+            if attempt == attempts - 1:
+                raise
+
 
 class PredictionModel(object):
     """Prediction model skeleton"""
 
+    incremental = False  # Whether update_model is supported
+
     def __init__(self, name, json_file, parameters, **model_kwargs):
         self.name = name
         self.JSON_FILE = json_file
@@ -16,23 +43,74 @@ class PredictionModel(object):
     def predict(self, *args):
         return 0
 
+    def predict_batch(self, x):
+        """
+        Predict disruptions for many feature rows with a single model call
+
+        :param x: 2-D array of features in features.FEATURES order, extra columns are ignored. Alternatively a dict of
+                  FMI weather forecasts.
+        :return: array of predicted disruption amounts, or dict of {timestamp: disruption amount} for forecasts
+        """
+        import numpy as np
+
+        if isinstance(x, dict):
+            from features import forecast_features
+            timestamps, x = forecast_features(x)
+            return dict(zip(timestamps, self.predict_batch(x).tolist()))
+
+        x = np.asarray(x, dtype=float)
+        if not len(x):
+            return np.zeros(0, dtype=int)
+
+        with metrics.span('predict'):
+            return self._predict_array(x[:, :self.parameters])
+
+    def _predict_array(self, x):
+        import numpy as np
+        return np.zeros(len(x), dtype=int)
+
     def generate_model(self, x, y):
         pass
 
+    def update_model(self, x, y):
+        """
+        Train the generated model further with new data, for models supporting incremental training
+        """
+        raise NotImplementedError('Model %s does not support incremental training' % self.name)
+
     def save_model(self):
         pass
 
-    def load_model(self):
+    def load_model(self, mmap_mode='r'):
         pass
 
+    def load_estimator(self, mmap_mode='r'):
+        '''
+        Load the generated scikit-learn estimator, for models whose load_model loads a faster representation
+        '''
+        self.load_model(mmap_mode)
+
 
 class ScikitPredictor(PredictionModel):
-    """Pre-calculated Scikit-learn prediction model"""
+    """Pre-calculated Scikit-learn prediction model, loaded from the model file on first use"""
+
+    ARTIFACT_VERSION = 1  # Model file format version
 
     def __init__(self, name, json_file, parameters, model_file, **model_kwargs):
         super(ScikitPredictor, self).__init__(name, json_file, parameters, **model_kwargs)
         self.model = None
         self.filename = model_file
+        self.load_attempted = False
+
+    @property
+    def model(self):
+        if self._model is None and not self.load_attempted:
+            self.load_model()
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
 
     def predict(self, *args):
         val = self.model.predict(*args)
@@ -41,19 +119,73 @@ class ScikitPredictor(PredictionModel):
         else:
             return int(val)
 
+    def _predict_array(self, x):
+        import numpy as np
+        return np.asarray(self.model.predict(x)).astype(int)
+
     def save_model(self):
+        '''
+        Save the model as an uncompressed versioned artifact, so that its numeric arrays can be memory-mapped on load
+        '''
+        import glob
+        import os
+        import time
         from sklearn.externals import joblib
-        joblib.dump(self.model, self.filename)
 
-    def load_model(self):
+        artifact = {'version': self.ARTIFACT_VERSION, 'name': self.name, 'model': self.model}
+
+        # Joblib before 0.10 writes arrays to <file>_NN.npy files next to the pickle, which refers to them by name.
+        # Every save gets unique names, so that arrays memory-mapped by other processes are never overwritten.
+        temp_filename = '%s.%d-%d.tmp' % (self.filename, int(time.time() * 1000), os.getpid())
+        joblib.dump(artifact, temp_filename, compress=0)
+
+        # Replace atomically, as other processes may be loading the model
+        os.rename(temp_filename, self.filename)
+
+        # Remove arrays of earlier saves, including <file>_NN.npy files of saves to the model file itself
+        for array_file in glob.glob(self.filename + '_*.npy') + glob.glob(self.filename + '.*.npy'):
+            if array_file.rsplit('_', 1)[0] != temp_filename:
+                os.remove(array_file)
+
+    def load_model(self, mmap_mode='r'):
+        '''
+        Load the model memory-mapped, so that processes using the same model share its pages. Plain pickled models
+        of older versions are also accepted.
+
+        :param mmap_mode: numpy memory-map mode, None to load a modifiable copy e.g. for incremental training
+        '''
         from sklearn.externals import joblib
-        try:
-            self.model = joblib.load(self.filename)
-        except IOError:
-            pass
+        self.load_attempted = True
+        with metrics.span('load_model'):
+            artifact = _load_file(lambda filename: joblib.load(filename, mmap_mode=mmap_mode), self.filename)
+        if artifact is None:
+            return
+
+        if isinstance(artifact, dict) and 'version' in artifact:
+            if artifact['version'] > self.ARTIFACT_VERSION:
+                raise ValueError('Model file %s has unsupported version %s' % (self.filename, artifact['version']))
+            artifact = artifact['model']
+
+        self.model = artifact
 
 
 class ModelNN(ScikitPredictor):
+    """
+    K nearest neighbors model. Neighbors are searched with a spatial index, selected with the algorithm ('kd_tree',
+    'ball_tree' or 'brute') and leaf_size keyword arguments of KNeighborsRegressor, so query time grows only
+    logarithmically with the amount of training data. New data points can be appended incrementally, see
+    neighbors.AppendableNeighborsRegressor.
+    """
+
+    incremental = True
+
+    def __init__(self, name, json_file, parameters, model_file, standardize=True, **model_kwargs):
+        """
+        :param standardize: scale features to zero mean and unit variance, so that they weigh equally in distances.
+                            The training data is standardized once before building the index.
+        """
+        super(ModelNN, self).__init__(name, json_file, parameters, model_file, **model_kwargs)
+        self.standardize = standardize
 
     def generate_model(self, x, y):
         '''
@@ -61,11 +193,16 @@ class ModelNN(ScikitPredictor):
 
         :return: None
         '''
-        from sklearn.neighbors import KNeighborsRegressor
+        from neighbors import AppendableNeighborsRegressor
 
-        self.model = KNeighborsRegressor(**self.model_kwargs)
+        self.model = AppendableNeighborsRegressor(standardize=self.standardize, **self.model_kwargs)
         self.model.fit(x, y)
 
+    def update_model(self, x, y):
+        if not hasattr(self.model, 'partial_fit'):
+            raise ValueError('Model %s was generated by an older version, regenerate it first' % self.name)
+        self.model.partial_fit(x, y)
+
 
 class ModelLogisticRegression(ScikitPredictor):
 
@@ -81,6 +218,32 @@ class ModelLogisticRegression(ScikitPredictor):
         self.model.fit(x, y)
 
 
+class ModelSGDRegression(ScikitPredictor):
+    """
+    Linear regression fitted by stochastic gradient descent on standardized features. The model can be trained
+    further with new data without going through earlier data, and the standardization stays as in initial training.
+    """
+
+    incremental = True
+
+    def generate_model(self, x, y):
+        '''
+        Generate model to predict y from x
+
+        :return: None
+        '''
+        from sklearn import linear_model
+        from sklearn.pipeline import make_pipeline
+        from sklearn.preprocessing import StandardScaler
+
+        self.model = make_pipeline(StandardScaler(), linear_model.SGDRegressor(**self.model_kwargs))
+        self.model.fit(x, y)
+
+    def update_model(self, x, y):
+        scaler, regressor = [step for _, step in self.model.steps]
+        regressor.partial_fit(scaler.transform(x), y)
+
+
 class ModelLinearRegression(ScikitPredictor):
 
     def generate_model(self, x, y):
@@ -96,6 +259,20 @@ class ModelLinearRegression(ScikitPredictor):
 
 
 class ModelRandomForest(ScikitPredictor):
+    """
+    Random forest classifier. Saved forests are also exported as a forest.CompiledForest, which is loaded for
+    predictions instead of the pickled estimator.
+    """
+
+    FOREST_SUFFIX = '.forest'
+    n_jobs = None  # Amount of threads for fitting trees, unless given in model_kwargs. None for one thread.
+    compiled = None  # CompiledForest of a generated estimator, for fast predictions
+    compiled_from = None  # Estimator that was compiled
+
+    @property
+    def forest_filename(self):
+        import os
+        return os.path.splitext(self.filename)[0] + self.FOREST_SUFFIX
 
     def generate_model(self, x, y):
         '''
@@ -105,10 +282,56 @@ class ModelRandomForest(ScikitPredictor):
         '''
         from sklearn import ensemble
 
+        kwargs = dict(self.model_kwargs)
+        if self.n_jobs:
+            kwargs.setdefault('n_jobs', self.n_jobs)
+
         # Classifier seems to outperform RandomForestRegressor by far...
-        self.model = ensemble.RandomForestClassifier(**self.model_kwargs)
+        self.model = ensemble.RandomForestClassifier(**kwargs)
         self.model.fit(x, y)
 
+    def _compile(self):
+        from forest import CompiledForest
+
+        model = self.model
+        if isinstance(model, CompiledForest):
+            return model
+
+        if self.compiled_from is not model:
+            self.compiled = CompiledForest.from_forest(model)
+            self.compiled_from = model
+        return self.compiled
+
+    def _predict_array(self, x):
+        return self._compile().predict(x).astype(int)
+
+    def save_model(self):
+        '''
+        Export the forest, then save the estimator. The model file changes last, so processes reloading the model
+        when it changes find the new export.
+        '''
+        self._compile().save(self.forest_filename)
+        super(ModelRandomForest, self).save_model()
+
+    def load_model(self, mmap_mode='r'):
+        '''
+        Load the exported forest memory-mapped, so that processes using the same forest share its pages. Forests
+        saved without an export are loaded from the model file.
+        '''
+        from forest import CompiledForest
+
+        self.load_attempted = True
+        with metrics.span('load_model'):
+            forest = _load_file(lambda filename: CompiledForest.load(filename, mmap_mode=mmap_mode),
+                                self.forest_filename)
+        if forest is None:
+            self.load_estimator(mmap_mode)
+        else:
+            self.model = forest
+
+    def load_estimator(self, mmap_mode='r'):
+        super(ModelRandomForest, self).load_model(mmap_mode)
+
 
 def init_models():
     """
@@ -123,8 +346,10 @@ def init_models():
     #models.append(ModelLinearRegression('Linear Regression', 'data/disruptions_linear_regression.json', 4, 'model/linear.pkl'))
     #models.append(ScikitPredictor('Linear Regression', 'data/disruptions_linear_regression_2.json', 3, 'model/linear2.pkl'))
     #models.append(ModelNN('2NN', 'data/2nn.json', 4, 'model/2nn.pkl', n_neighbors=2))
-    models.append(ModelNN('3NN', 'data/3nn.json', 4, 'model/3nn.pkl', n_neighbors=3))
-    models.append(ModelNN('4NN', 'data/4nn.json', 4, 'model/4nn.pkl', n_neighbors=4))
+    models.append(ModelNN('3NN', 'data/3nn.json', 4, 'model/3nn.pkl', n_neighbors=3, algorithm='kd_tree', leaf_size=10))
+    models.append(ModelNN('4NN', 'data/4nn.json', 4, 'model/4nn.pkl', n_neighbors=4, algorithm='kd_tree', leaf_size=10))
+    models.append(ModelSGDRegression('SGD Regression', 'data/sgd_regression.json', 4, 'model/sgd_regression.pkl',
+                                     n_iter=20, random_state=0))
     models.append(
         ModelRandomForest('Simple Forest', 'data/simple_forest.json', 6, 'model/simple_forest.pkl', n_estimators=50))
     models.append(
@@ -135,7 +360,8 @@ def init_models():
 
 def load_models(models):
     """
-    Import models from generated pickle files.
+    Import models from generated pickle files. Models are also loaded automatically on first use, so this is only
+    needed for loading them in advance.
 
     :parameter models: list of PredictionModel
     """
@@ -143,16 +369,49 @@ def load_models(models):
         model.load_model()
 
 
-def generate_models(models, xx, yy):
+def _train(task):
+    '''
+    Generate and save a model in a worker process. Saving overlaps with training of other models in other workers.
+
+    :param task: (model index, model)
+    :return: model index
+    '''
+    import workers
+
+    index, model = task
+    xx = workers.state['xx']
+    model.generate_model(xx[model.parameters] if isinstance(xx, dict) else xx, workers.state['yy'])
+    model.save_model()
+    return index
+
+
+def generate_models(models, xx, yy, processes=None, n_jobs=None):
     """
-    Generate and save models to pickle files.
+    Generate and save models to pickle files. Models are trained concurrently in a process pool, so training all of
+    them takes roughly as long as training the slowest one.
 
     @type  models: list[PredictionModel]
+    :param xx: feature matrix, or dict of {amount of parameters: feature matrix}
+    :param processes: amount of worker processes, defaults to one for each model
+    :param n_jobs: amount of threads for fitting each random forest
     """
+    import workers
+
     for model in models:
-        model.generate_model(xx, yy)
-        model.save_model()
-        print 'Saved model %s' % model.name
+        if n_jobs and isinstance(model, ModelRandomForest):
+            model.n_jobs = n_jobs
+
+    pool = workers.pool(processes or len(models), xx=xx, yy=yy)
+    try:
+        for index in pool.imap_unordered(_train, list(enumerate(models))):
+            # Generated models are large, so they are loaded from the saved file on use instead of sent back
+            if isinstance(models[index], ScikitPredictor):
+                models[index].model = None
+                models[index].load_attempted = False
+            print 'Saved model %s' % models[index].name
+    finally:
+        pool.close()
+        pool.join()
 
 
 prediction_models = init_models()
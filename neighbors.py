@@ -0,0 +1,83 @@
+"""Nearest neighbors regression accepting appended training points"""
+
+import numpy as np
+
+
+class AppendableNeighborsRegressor(object):
+    """
+    K nearest neighbors regressor with uniform weights whose training data can be extended without rebuilding the
+    spatial index every time.
+
+    Appended points are kept in a small buffer that is searched by brute force alongside the index, and the index is
+    rebuilt with all points only once the buffer grows past rebuild_ratio of the indexed points. Features are
+    standardized with the mean and deviation of the initial training data, which stay fixed when points are appended.
+    """
+
+    def __init__(self, n_neighbors=5, standardize=True, rebuild_ratio=0.1, **index_kwargs):
+        """
+        :param standardize: scale features to zero mean and unit variance, so that they weigh equally in distances
+        :param rebuild_ratio: rebuild the index when appended points exceed this ratio of indexed points
+        :param index_kwargs: keyword arguments of sklearn.neighbors.KNeighborsRegressor, e.g. algorithm and leaf_size
+        """
+        self.n_neighbors = n_neighbors
+        self.standardize = standardize
+        self.rebuild_ratio = rebuild_ratio
+        self.index_kwargs = index_kwargs
+        self.index = None
+
+    def _scale(self, x):
+        x = np.asarray(x, dtype=float)
+        if self.standardize:
+            return (x - self.mean) / self.scale
+        return x
+
+    def _build_index(self, x, y):
+        from sklearn.neighbors import KNeighborsRegressor
+
+        self.index = KNeighborsRegressor(n_neighbors=self.n_neighbors, **self.index_kwargs)
+        self.index.fit(x, y)
+        self.x = x
+        self.y = np.asarray(y)
+        self.appended_x = np.zeros((0, x.shape[1]))
+        self.appended_y = np.zeros(0, dtype=self.y.dtype)
+
+    def fit(self, x, y):
+        x = np.asarray(x, dtype=float)
+        if self.standardize:
+            self.mean = x.mean(axis=0)
+            self.scale = x.std(axis=0)
+            self.scale[self.scale == 0.0] = 1.0
+
+        self._build_index(self._scale(x), y)
+        return self
+
+    def partial_fit(self, x, y):
+        '''
+        Append training points
+        '''
+        if self.index is None:
+            return self.fit(x, y)
+
+        self.appended_x = np.vstack((self.appended_x, self._scale(x)))
+        self.appended_y = np.concatenate((self.appended_y, y))
+
+        if len(self.appended_y) > self.rebuild_ratio * len(self.y):
+            self._build_index(np.vstack((self.x, self.appended_x)), np.concatenate((self.y, self.appended_y)))
+        return self
+
+    def predict(self, x):
+        '''
+        :return: mean target value of the nearest neighbors of each row
+        '''
+        x = self._scale(x)
+        if not len(self.appended_y):
+            return self.index.predict(x)
+
+        distances, indexes = self.index.kneighbors(x, n_neighbors=min(self.n_neighbors, len(self.y)))
+        appended_distances = np.sqrt(((x[:, np.newaxis, :] - self.appended_x[np.newaxis, :, :]) ** 2).sum(axis=2))
+
+        distances = np.hstack((distances, appended_distances))
+        targets = np.hstack((self.y[indexes], np.tile(self.appended_y, (len(x), 1))))
+
+        nearest = np.argsort(distances, axis=1, kind='mergesort')[:, :self.n_neighbors]
+        return targets[np.arange(len(x))[:, np.newaxis], nearest].mean(axis=1)
@@ -2,19 +2,41 @@
 
 import argparse
 
-from models import prediction_models, load_models
-
-load_models(prediction_models)
+from models import prediction_models
 
 parser = argparse.ArgumentParser(description='Predict traffic disruptions')
 parser.add_argument('temperature', help='Temperature [C]', type=float)
 parser.add_argument('rainfall', help='Precipitation [mm]', type=float)
 parser.add_argument('windspeed', help='Wind speed [m/s]', type=float)
 parser.add_argument('hour', help='Hour of the day', type=int)
+parser.add_argument('weekday', help='ISO weekday, 1 for Monday. Needed by models using weekday and month', type=int,
+                    nargs='?')
+parser.add_argument('month', help='Month, 1 for January', type=int, nargs='?')
+parser.add_argument('-m', '--model', help='Name of model to use, can be repeated (default: all models that need '
+                                          'only the given values)',
+                    dest='models', action='append', choices=[model.name for model in prediction_models])
 args = parser.parse_args()
 
-for model in prediction_models:
+# Values in features.FEATURES order
+value_tuple = (args.rainfall, args.temperature, args.windspeed, args.hour)
+if args.weekday is not None:
+    value_tuple += (args.weekday,)
+    if args.month is not None:
+        value_tuple += (args.month,)
+
+# Models are loaded lazily, so only the selected ones are unpickled
+if args.models:
+    selected_models = [model for model in prediction_models if model.name in args.models]
+    for model in selected_models:
+        if model.parameters > len(value_tuple):
+            parser.error('Model %s needs %s values' % (model.name, model.parameters))
+else:
+    selected_models = [model for model in prediction_models if model.parameters <= len(value_tuple)]
+
+for model in selected_models:
     #print 'Model %s' % (model.model)
-    value_tuple = (args.rainfall, args.temperature, args.windspeed, args.hour)
-    prediction = model.predict(value_tuple[:model.parameters])
+    if model.model is None:
+        print 'Model %s is not generated yet, run generate_models.py first' % model.name
+        continue
+    prediction = model.predict_batch([value_tuple])[0]
     print 'Model %s: %s' % (model.name, prediction)
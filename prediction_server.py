@@ -0,0 +1,163 @@
+"""HTTP server keeping prediction models in memory and serving predictions as JSON
+
+Endpoints:
+    GET /models     List available models
+    POST /predict   Predict disruptions. Request body: {"features": [[precipitation, temperature, wind speed, hour,
+                    weekday, month], ...], "models": [model name, ...]}. A single feature row is also accepted and
+                    "models" defaults to all models. Response: {"predictions": {model name: [prediction, ...]}}.
+
+Models are reloaded when their model files change.
+"""
+
+import argparse
+import BaseHTTPServer
+import json
+import logging
+import os
+import SocketServer
+import threading
+import time
+
+from models import prediction_models, load_models
+
+
+class ModelRegistry(object):
+    """
+    Warm prediction models, reloading a model when its model file is modified
+    """
+
+    def __init__(self, models, check_interval=1.0):
+        """
+        :param models: list of PredictionModel
+        :param check_interval: minimum time between model file checks in seconds
+        """
+        self.models = dict((model.name, model) for model in models)
+        self.check_interval = check_interval
+        self.mtimes = {}
+        self.checked = 0
+        self.lock = threading.Lock()
+
+        load_models(models)
+        for model in models:
+            self.mtimes[model.name] = self._mtime(model)
+
+    @staticmethod
+    def _mtime(model):
+        filename = getattr(model, 'filename', None)
+        if filename and os.path.exists(filename):
+            return os.path.getmtime(filename)
+        return None
+
+    def reload_changed(self):
+        '''
+        Reload models whose files have changed since they were loaded
+        '''
+        now = time.time()
+        if now - self.checked < self.check_interval:
+            return
+
+        with self.lock:
+            self.checked = now
+            for name, model in self.models.iteritems():
+                mtime = self._mtime(model)
+                if mtime != self.mtimes[name]:
+                    logging.info('Reloading model %s' % name)
+                    model.load_model()
+                    self.mtimes[name] = mtime
+
+    def predict(self, features, names=None):
+        '''
+        :param features: list of feature rows
+        :param names: list of model names, None for all models
+        :return: dict of {model name: list of predictions}
+        '''
+        self.reload_changed()
+
+        if names is None:
+            names = sorted(self.models)
+
+        unknown = [name for name in names if name not in self.models or self.models[name].model is None]
+        if unknown:
+            raise ValueError('Unknown or ungenerated models: %s' % ', '.join(unknown))
+
+        return dict((name, self.models[name].predict_batch(features).tolist()) for name in names)
+
+
+class PredictionHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Request handler using the ModelRegistry of its server
+    """
+
+    def _respond(self, status, data):
+        body = json.dumps(data)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/models':
+            return self._respond(404, {'error': 'Not found'})
+
+        models = self.server.registry.models.values()
+        self._respond(200, {'models': [{'name': model.name, 'parameters': model.parameters} for model in models]})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            return self._respond(404, {'error': 'Not found'})
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.getheader('Content-Length', 0))))
+            features = request['features']
+            if features and not isinstance(features[0], list):
+                features = [features]
+            predictions = self.server.registry.predict(features, request.get('models'))
+        except (ValueError, KeyError, TypeError, IndexError) as e:
+            return self._respond(400, {'error': str(e)})
+
+        self._respond(200, {'predictions': predictions})
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return str(self.client_address)
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(registry, host='localhost', port=8000, socket_file=None):
+    '''
+    Create a HTTP server listening on a TCP port, or on a Unix socket if socket_file is given
+    '''
+    if socket_file:
+        if os.path.exists(socket_file):
+            os.remove(socket_file)
+        server = ThreadingUnixHTTPServer(socket_file, PredictionHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), PredictionHandler)
+
+    server.registry = registry
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve traffic disruption predictions')
+    parser.add_argument('--host', help='Host to listen on', default='localhost')
+    parser.add_argument('--port', help='Port to listen on', type=int, default=8000)
+    parser.add_argument('--socket', help='Listen on this Unix socket instead of a TCP port', dest='socket_file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    server = create_server(ModelRegistry(prediction_models), args.host, args.port, args.socket_file)
+    logging.info('Serving predictions on %s' % (args.socket_file or '%s:%s' % (args.host, args.port)))
+    server.serve_forever()
@@ -0,0 +1,205 @@
+"""Parallel hyperparameter search for prediction models"""
+
+import copy
+import hashlib
+import itertools
+import json
+import logging
+import math
+import os
+import random
+
+import numpy as np
+
+import workers
+
+
+def _evaluate(task):
+    '''
+    Fit a copy of the model with given parameters and score it against the test data
+
+    :param task: (candidate index, parameters, amount of training samples or None for all)
+    :return: (candidate index, parameters, samples, score)
+    '''
+    index, params, samples = task
+
+    model = copy.copy(workers.state['model'])
+    model.model_kwargs = params
+
+    rows = workers.state['order'][:samples] if samples else slice(None)
+    model.generate_model(workers.state['x_train'][rows], workers.state['y_train'][rows])
+
+    return index, params, samples, model.model.score(workers.state['x_test'], workers.state['y_test'])
+
+
+def grid(space):
+    '''
+    All combinations of a parameter space
+
+    >>> print grid({'a': [1, 2], 'b': [None]})
+    [{'a': 1, 'b': None}, {'a': 2, 'b': None}]
+
+    :param space: dict of {parameter name: list of values}
+    :rtype : list[dict]
+    '''
+    names = sorted(space)
+    return [dict(zip(names, values)) for values in itertools.product(*[space[name] for name in names])]
+
+
+def sample(space, amount, seed=None):
+    '''
+    Random distinct combinations of a parameter space
+
+    :rtype : list[dict]
+    '''
+    candidates = grid(space)
+    return random.Random(seed).sample(candidates, min(amount, len(candidates)))
+
+
+def fingerprint(*arrays):
+    '''
+    Hash identifying the contents of numpy arrays
+    '''
+    digest = hashlib.sha1()
+    for array in arrays:
+        digest.update(str(array.shape))
+        digest.update(np.ascontiguousarray(array).tostring())
+    return digest.hexdigest()
+
+
+class SearchCache(object):
+    """
+    On-disk cache of evaluated parameters and their scores. Results are appended as JSON lines as soon as they are
+    known, so an interrupted search can be resumed.
+    """
+
+    def __init__(self, filename, data_key):
+        """
+        :param filename: JSON lines file, None for an in-memory cache
+        :param data_key: key identifying the model and data the scores were calculated for
+        """
+        self.filename = filename
+        self.data_key = data_key
+        self.scores = {}
+
+        if filename and os.path.exists(filename):
+            with open(filename, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry['data'] == data_key:
+                        self.scores[self._key(entry['params'], entry['samples'])] = entry['score']
+            logging.info('Read %s cached search results from %s' % (len(self.scores), filename))
+
+    @staticmethod
+    def _key(params, samples):
+        return json.dumps([params, samples], sort_keys=True)
+
+    def get(self, params, samples):
+        return self.scores.get(self._key(params, samples))
+
+    def add(self, params, samples, score):
+        self.scores[self._key(params, samples)] = score
+        if self.filename:
+            with open(self.filename, 'a') as f:
+                f.write(json.dumps({'data': self.data_key, 'params': params, 'samples': samples, 'score': score}) + '\n')
+
+
+class ParameterSearch(object):
+    """
+    Hyperparameter search fitting candidate models in a process pool.
+
+    Candidates are scored by model.model.score() against the test data. The model given to the search is never
+    modified, use the returned best parameters to generate the final model.
+    """
+
+    def __init__(self, model, cache_file=None, processes=None, patience=None, verbose=False):
+        """
+        :param model: PredictionModel used as template for the candidates
+        :param cache_file: file for caching scores between runs
+        :param processes: number of worker processes, defaults to CPU count
+        :param patience: stop after this many evaluated candidates without improvement
+        :param verbose: log each improvement
+        """
+        self.model = model
+        self.cache_file = cache_file
+        self.processes = processes
+        self.patience = patience
+        self.verbose = verbose
+        self.best_params = {}
+        self.best_score = None
+
+    def _run_round(self, pool, cache, candidates, samples, stop_early):
+        '''
+        Score candidates with the given amount of training samples
+
+        :return: list of (score, candidate index, parameters), sorted from best to worst
+        '''
+        results = []
+        tasks = []
+        for index, params in enumerate(candidates):
+            score = cache.get(params, samples)
+            if score is None:
+                tasks.append((index, params, samples))
+            else:
+                results.append((score, index, params))
+
+        logging.info('Scoring %s candidates with %s samples, %s cached' %
+                     (len(candidates), samples or 'all', len(results)))
+
+        best = max([score for score, _, _ in results] or [None])
+        unimproved = 0
+
+        for index, params, samples, score in pool.imap_unordered(_evaluate, tasks):
+            cache.add(params, samples, score)
+            results.append((score, index, params))
+
+            if best is None or score > best:
+                best = score
+                unimproved = 0
+                if self.verbose:
+                    print "%s -- %s" % (score, params)
+            else:
+                unimproved += 1
+                if stop_early and self.patience and unimproved >= self.patience:
+                    logging.info('No improvement in %s candidates, stopping search' % unimproved)
+                    break
+
+        # Ties are resolved by candidate order to keep results independent of completion order
+        return sorted(results, key=lambda result: (-result[0], result[1]))
+
+    def run(self, candidates, x_train, y_train, x_test, y_test, halving=False, eta=3, min_samples=1000):
+        '''
+        Search the best parameters among candidates
+
+        :param candidates: list of parameter dicts, see grid() and sample()
+        :param halving: use successive halving, scoring all candidates with a subsample of training data and
+                        continuing with the best 1 / eta of them with eta times more data
+        :param eta: reduction factor for successive halving
+        :param min_samples: minimum amount of training samples for successive halving
+        :return: (best parameters, best score)
+        '''
+        data_key = '%s:%s' % (self.model.__class__.__name__, fingerprint(x_train, y_train, x_test, y_test))
+        cache = SearchCache(self.cache_file, data_key)
+
+        order = np.random.RandomState(0).permutation(len(x_train))
+        pool = workers.pool(self.processes, model=self.model, x_train=x_train, y_train=y_train, x_test=x_test,
+                            y_test=y_test, order=order)
+
+        try:
+            if halving and len(candidates) > 1:
+                rounds = int(math.ceil(math.log(len(candidates), eta)))
+                samples = max(min_samples, len(x_train) // eta ** rounds)
+                while len(candidates) > 1 and samples < len(x_train):
+                    results = self._run_round(pool, cache, candidates, samples, stop_early=False)
+                    candidates = [params for _, _, params in results[:max(1, len(results) // eta)]]
+                    samples *= eta
+
+            results = self._run_round(pool, cache, candidates, None, stop_early=True)
+        finally:
+            pool.terminate()
+
+        self.best_score, _, self.best_params = results[0]
+        return self.best_params, self.best_score
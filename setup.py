@@ -8,7 +8,7 @@ setup(
     name='traffic_disruption',
     version=version,
     author='Mikko Koho',
-    py_modules=['apiharvester', 'models'],
+    py_modules=['apiharvester', 'datastore', 'features', 'forest', 'httpcache', 'metrics', 'models', 'neighbors', 'search', 'timeindex', 'timezones', 'workers'],
     install_requires=[
         'lxml >= 3.1.2',
         'iso8601',
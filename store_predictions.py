@@ -1,78 +1,140 @@
-"""Predict traffic disruptions based on next 24h weather forecast and save predictions to file."""
+"""Predict traffic disruptions based on next 24h weather forecasts of weather stations and save predictions to file.
 
+Forecasts and predictions of the default station are stored in the plain data files, other stations get their own
+files named after the station.
+"""
+
+import argparse
+import hashlib
 import json
 import os
+import re
 from datetime import timedelta, datetime
 from dateutil import tz
 
-import iso8601
+import numpy as np
 import pytz
-from sklearn.externals import joblib
 
 from apiharvester import APIHarvester
-from models import prediction_models, load_models
+from datastore import JsonLogStore
+from features import forecast_features
+import metrics
+from models import prediction_models
+from timeindex import datetime_seconds, hour_datetime
+from timezones import HOUR
 
 FORECAST_FILE = 'data/forecasts.json'
+FORECAST_TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'  # Timestamps of FMI forecasts
 OBSERVED_DISRUPTIONS_FILE = 'data/disruptions_observed.json'
+HSL_WORKERS = 4
+FMI_WORKERS = 4
 
-harvester = APIHarvester()
 
-forecasts = harvester.fmi_forecast()
+def forecast_digest(values):
+    """
+    Content hash of forecast values for a single time instant
+    """
+    return hashlib.sha1(json.dumps(values, sort_keys=True)).hexdigest()
 
-# Store weather forecasts
 
-stored_forecasts = harvester.read_datafile(FORECAST_FILE) or {}
-stored_forecasts.update(forecasts)
+def station_file(filename, place):
+    """
+    Data file of a weather station
 
-with open(FORECAST_FILE, 'w') as f:
-    json.dump(stored_forecasts, f)
+    >>> print station_file('data/3nn.json', 'Vantaa, Helsinki-Vantaan lentoasema')
+    data/3nn_vantaa_helsinki_vantaan_lentoasema.json
+    """
+    if place == APIHarvester.FMI_PLACE:
+        return filename
 
-# Load stored disruptions
+    root, extension = os.path.splitext(filename)
+    return '%s_%s%s' % (root, re.sub(r'[^a-z0-9]+', '_', place.lower()).strip('_'), extension)
 
-for model in prediction_models:
-    model.stored_disruptions = harvester.read_datafile(model.JSON_FILE) or {}
 
-# Predict disruptions
+parser = argparse.ArgumentParser(description='Predict traffic disruptions based on weather forecasts')
+parser.add_argument('-s', '--station', help='FMI weather station place name, may be given multiple times. '
+                                            'Defaults to %s' % APIHarvester.FMI_PLACE,
+                    dest='stations', action='append')
+metrics.add_argument(parser)
+args = parser.parse_args()
 
-load_models(prediction_models)
+if args.metrics:
+    metrics.enable()
 
-for model in prediction_models:
-    for timestamp, values in forecasts.iteritems():
+stations = args.stations or [APIHarvester.FMI_PLACE]
+
+harvester = APIHarvester()
+
+station_forecasts = harvester.fmi_forecasts(stations, workers=FMI_WORKERS)
+
+# Store changed weather forecasts
 
-#        if timestamp in model.stored_disruptions:
-#            continue
+stored_forecasts = {}
+changed_forecasts = {}
 
-        obs_time = iso8601.parse_date(timestamp)
-        value_tuple = (float(values['Precipitation1h']), float(values['Temperature']), float(values['WindSpeedMS']),
-                       obs_time.hour, obs_time.isoweekday(), obs_time.month)
-        # Strip extra values
-        disruption_amount = model.predict(value_tuple[:model.parameters])
-        model.disruptions.update({timestamp: disruption_amount})
+for place, forecasts in station_forecasts.iteritems():
+    forecast_store = JsonLogStore(station_file(FORECAST_FILE, place))
+    stored_forecasts[place] = forecast_store.read()
 
-# Store predicted disruptions
+    changed_forecasts[place] = dict((timestamp, values) for timestamp, values in forecasts.iteritems()
+                                    if timestamp not in stored_forecasts[place] or
+                                    forecast_digest(stored_forecasts[place][timestamp]) != forecast_digest(values))
+
+    forecast_store.upsert(changed_forecasts[place])
+
+# Predict disruptions for changed forecasts and timestamps not yet predicted, and store them. Forecasts of all stations
+# are stacked into a single feature matrix, so each model makes one batch prediction.
 
 for model in prediction_models:
-    model.stored_disruptions.update(model.disruptions)
+    disruption_stores = {}
+    timestamps = []
+    matrices = []
+
+    for place, forecasts in station_forecasts.iteritems():
+        disruption_stores[place] = JsonLogStore(station_file(model.JSON_FILE, place))
+        stored_disruptions = disruption_stores[place].read()
+
+        new_forecasts = dict((timestamp, values) for timestamp, values in forecasts.iteritems()
+                             if timestamp in changed_forecasts[place] or timestamp not in stored_disruptions)
 
-    with open(model.JSON_FILE, 'w') as f:
-        json.dump(model.stored_disruptions, f)
+        station_timestamps, x = forecast_features(new_forecasts)
+        timestamps.append((place, station_timestamps))
+        matrices.append(x)
 
+    if not sum(len(x) for x in matrices):
+        continue
 
-# Get and store observed disruptions
+    predictions = model.predict_batch(np.vstack(matrices)).tolist()
 
-stored_observed_disruptions = harvester.read_datafile(OBSERVED_DISRUPTIONS_FILE) or {}
+    start = 0
+    for place, station_timestamps in timestamps:
+        end = start + len(station_timestamps)
+        if end > start:
+            disruption_stores[place].upsert(dict(zip(station_timestamps, predictions[start:end])))
+        start = end
 
-observed_disruptions = {}
+
+# Get and store observed disruptions for hours of the past two days forecasted for any station and not observed yet
+
+observed_store = JsonLogStore(OBSERVED_DISRUPTIONS_FILE)
+stored_observed_disruptions = observed_store.read()
 
 now_time = datetime.utcnow().replace(tzinfo=tz.tzutc())
 
-for timestamp, values in stored_forecasts.iteritems():
-    obs_time = iso8601.parse_date(timestamp)
-    if timedelta(0) < now_time - obs_time < timedelta(days=2):
-        #finnish_time = iso8601.parse_date(timestamp).astimezone(tz.gettz('Europe/Helsinki'))
-        observed_disruptions[timestamp] = harvester.hsl_api(obs_time)
+# Timestamps of the window are looked up directly, so the cost does not grow with the stored forecast history
+start_hour, end_hour = [-(-datetime_seconds(when) // HOUR) for when in (now_time - timedelta(days=2), now_time)]
+
+unobserved = {}
+for hour in range(start_hour, end_hour):
+    timestamp = hour_datetime(hour).strftime(FORECAST_TIME_FORMAT)
+    if timestamp not in stored_observed_disruptions and \
+            any(timestamp in forecasts for forecasts in stored_forecasts.itervalues()):
+        unobserved[hour_datetime(hour)] = timestamp
+
+observed_disruptions = dict((unobserved[obs_time], disruptions) for obs_time, disruptions in
+                            harvester.hsl_disruptions(unobserved.keys(), workers=HSL_WORKERS).iteritems())
 
-stored_observed_disruptions.update(observed_disruptions)
+observed_store.upsert(observed_disruptions)
 
-with open(OBSERVED_DISRUPTIONS_FILE, 'w') as f:
-    json.dump(stored_observed_disruptions, f)
+if args.metrics:
+    metrics.write(args.metrics)
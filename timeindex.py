@@ -0,0 +1,153 @@
+"""Time indexes for hourly timestamp keyed data"""
+
+import calendar
+from datetime import datetime
+
+import numpy as np
+from dateutil import tz
+
+from timezones import HOUR, epoch_seconds
+
+
+def epoch_hours(timestamps, default_zone='UTC'):
+    '''
+    Parse ISO 8601 timestamps into integer hours since the epoch (UTC), truncating minutes and seconds
+
+    :rtype : numpy.ndarray
+    '''
+    return epoch_seconds(timestamps, default_zone) // HOUR
+
+
+def datetime_seconds(when):
+    '''
+    Seconds since the epoch of a timezone aware datetime
+    '''
+    return calendar.timegm(when.utctimetuple())
+
+
+def hour_datetime(hour):
+    '''
+    Timezone aware UTC datetime of hours since the epoch
+    '''
+    return datetime.utcfromtimestamp(int(hour) * HOUR).replace(tzinfo=tz.tzutc())
+
+
+def year_mask(hours, years):
+    '''
+    Mask of hours within the given years (UTC)
+
+    :param hours: array of hours since the epoch
+    :param years: list of years as integers or strings
+    '''
+    hour_years = np.asarray(hours).astype('datetime64[h]').astype('datetime64[Y]').astype(np.int64) + 1970
+    return np.in1d(hour_years, [int(year) for year in years])
+
+
+def date_mask(hours, dates):
+    '''
+    Mask of hours within the given dates (UTC)
+
+    :param hours: array of hours since the epoch
+    :param dates: list of dates as ISO 8601 strings
+    '''
+    return np.in1d(np.asarray(hours).astype('datetime64[h]').astype('datetime64[D]'),
+                   np.array(dates, dtype='datetime64[D]'))
+
+
+class TimeIndex(object):
+    """
+    Index of hourly timestamp keys, stored as integer hours since the epoch (UTC) sorted by time.
+
+    Keys may use any UTC offsets. Lookups by hour use a dense position table and take constant time, range queries
+    use binary search. If several keys fall on the same hour, lookups find the first of them.
+    """
+
+    def __init__(self, timestamps, default_zone='UTC'):
+        """
+        :param timestamps: iterable of ISO 8601 timestamps
+        :param default_zone: zone of timestamps without an UTC offset
+        """
+        keys = np.array(list(timestamps), dtype=object)
+        hours = epoch_hours(keys, default_zone)
+        order = np.argsort(hours, kind='mergesort')
+
+        self.hours = hours[order]
+        self.keys = keys[order]
+
+        self.first_hour = self.hours[0] if len(self.hours) else 0
+        span = self.hours[-1] - self.first_hour + 1 if len(self.hours) else 0
+        self.positions = np.empty(span, dtype=np.int64)
+        self.positions.fill(-1)
+        # Assign in reverse so that the first of duplicate hours wins
+        self.positions[(self.hours - self.first_hour)[::-1]] = np.arange(len(self.hours))[::-1]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def position(self, hour):
+        '''
+        Position of an hour in the index
+
+        :param hour: hours since the epoch
+        :return: position, or -1 if not indexed
+        '''
+        offset = hour - self.first_hour
+        if 0 <= offset < len(self.positions):
+            return self.positions[offset]
+        return -1
+
+    def get(self, hour):
+        '''
+        Timestamp key of an hour
+
+        :param hour: hours since the epoch
+        :return: key, or None if not indexed
+        '''
+        position = self.position(hour)
+        return self.keys[position] if position >= 0 else None
+
+    def slice(self, start_hour, end_hour):
+        '''
+        Positions of hours within [start_hour, end_hour)
+
+        :rtype : slice
+        '''
+        return slice(np.searchsorted(self.hours, start_hour, side='left'),
+                     np.searchsorted(self.hours, end_hour, side='left'))
+
+    def window(self, start, end):
+        '''
+        Positions of hours within [start, end)
+
+        :param start: timezone aware datetime
+        :param end: timezone aware datetime
+        :rtype : slice
+        '''
+        # Round up to whole hours
+        return self.slice(-(-datetime_seconds(start) // HOUR), -(-datetime_seconds(end) // HOUR))
+
+    def range(self, start, end):
+        '''
+        Timestamp keys of hours within [start, end)
+
+        :param start: timezone aware datetime
+        :param end: timezone aware datetime
+        :rtype : list
+        '''
+        return self.keys[self.window(start, end)].tolist()
+
+    def year_mask(self, years):
+        return year_mask(self.hours, years)
+
+    def date_mask(self, dates):
+        return date_mask(self.hours, dates)
+
+    def intersect(self, other):
+        '''
+        Join two indexes by hour
+
+        :param other: TimeIndex
+        :return: (sorted common hours, their positions in this index, their positions in the other index)
+        '''
+        common = np.intersect1d(self.hours, other.hours)
+        return common, self.positions[common - self.first_hour], other.positions[common - other.first_hour]
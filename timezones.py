@@ -0,0 +1,140 @@
+"""Bulk timezone normalization of ISO 8601 timestamps using NumPy datetime64 arrays"""
+
+import numpy as np
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Standard and summer time UTC offsets in seconds. Summer time follows the EU rules in use since 1996.
+ZONES = {
+    'UTC': None,
+    'Europe/Helsinki': (2 * HOUR, 3 * HOUR),
+}
+
+
+def _last_sunday_days(years, month):
+    '''
+    Days since the epoch of the last Sunday of a month for each year
+    '''
+    next_month = (years - 1970) * 12 + month  # Months since the epoch of the first day of the next month
+    last_day = np.array(next_month, dtype='datetime64[M]').astype('datetime64[D]').astype(np.int64) - 1
+    weekday = (last_day + 3) % 7  # Monday is 0, 1970-01-01 was a Thursday
+    return last_day - (weekday - 6) % 7
+
+
+def dst_transitions(first_year, last_year):
+    '''
+    EU summer time transitions, at 01:00 UTC on the last Sundays of March and October
+
+    :return: (start, end) arrays of UTC epoch seconds, indexed by year - first_year
+    '''
+    years = np.arange(first_year, last_year + 1, dtype=np.int64)
+    return _last_sunday_days(years, 3) * DAY + HOUR, _last_sunday_days(years, 10) * DAY + HOUR
+
+
+def local_to_utc(seconds, zone):
+    '''
+    Convert local wall clock times to UTC. Like dateutil, ambiguous times at the end of summer time and nonexistent
+    times at its start resolve to summer time.
+
+    :param seconds: array of local times as epoch seconds
+    :param zone: name of a zone in ZONES
+    :return: array of UTC epoch seconds
+    '''
+    seconds = np.asarray(seconds, dtype=np.int64)
+    offsets = ZONES[zone]
+    if offsets is None or not len(seconds):
+        return seconds
+
+    standard, summer = offsets
+    years = seconds.astype('datetime64[s]').astype('datetime64[Y]').astype(np.int64) + 1970
+    start, end = dst_transitions(years.min(), years.max())
+    index = years - years.min()
+
+    as_standard = seconds - standard
+    as_summer = seconds - summer
+    is_summer = (as_standard >= start[index]) & (as_summer < end[index])
+    return np.where(is_summer, as_summer, as_standard)
+
+
+def utc_offsets(suffixes):
+    '''
+    Parse UTC offset suffixes of ISO 8601 timestamps into seconds, -1 for suffixes without an offset
+
+    >>> print utc_offsets(['Z', '+02:00', '', '-0130']).tolist()
+    [0, 7200, -1, -5400]
+    '''
+    suffixes = np.asarray(suffixes, dtype=str)
+    unique, inverse = np.unique(suffixes, return_inverse=True)
+
+    offsets = []
+    for suffix in unique:
+        digits = suffix.replace(':', '')
+        if digits == 'Z':
+            offsets.append(0)
+        elif len(digits) == 5 and digits[0] in '+-':
+            offset = int(digits[1:3]) * HOUR + int(digits[3:5]) * 60
+            offsets.append(-offset if digits[0] == '-' else offset)
+        else:
+            offsets.append(-1)
+
+    return np.array(offsets, dtype=np.int64)[inverse]
+
+
+def epoch_seconds(timestamps, default_zone='UTC'):
+    '''
+    Parse ISO 8601 timestamps into UTC seconds since the epoch
+
+    :param timestamps: list of ISO 8601 strings with seconds precision
+    :param default_zone: zone of timestamps without an UTC offset
+    :rtype : numpy.ndarray
+    '''
+    timestamps = list(timestamps)
+
+    # Only dates are parsed as datetime64, as NumPy before 1.11 reads times without an UTC offset in host local time
+    days = np.array([timestamp[:10] for timestamp in timestamps], dtype='datetime64[D]').astype(np.int64)
+    clock = np.array([timestamp[11:13] + timestamp[14:16] + timestamp[17:19] for timestamp in timestamps],
+                     dtype=np.int64)
+    local = days * DAY + clock // 10000 * HOUR + clock // 100 % 100 * 60 + clock % 100
+    offsets = utc_offsets([timestamp[19:] for timestamp in timestamps])
+
+    naive = offsets == -1
+    utc = local - offsets
+    if naive.any():
+        utc[naive] = local_to_utc(local[naive], default_zone)
+    return utc
+
+
+def format_utc(seconds):
+    '''
+    Format UTC epoch seconds as ISO 8601 timestamps like datetime.isoformat() of UTC datetimes
+
+    :rtype : list
+    '''
+    strings = np.datetime_as_string(np.asarray(seconds, dtype=np.int64).astype('datetime64[s]'))
+    return np.char.add(strings.astype(str), '+00:00').tolist()
+
+
+def normalize_timestamps(timestamps, default_zone='UTC'):
+    '''
+    Convert ISO 8601 timestamps to UTC
+
+    >>> print normalize_timestamps(['2014-07-01T12:00:00', '2014-12-01T12:00:00Z'], 'Europe/Helsinki')
+    ['2014-07-01T09:00:00+00:00', '2014-12-01T12:00:00+00:00']
+
+    :param default_zone: zone of timestamps without an UTC offset
+    :rtype : list
+    '''
+    return format_utc(epoch_seconds(timestamps, default_zone))
+
+
+def normalize_data(data, default_zone='UTC'):
+    '''
+    Convert keys of timestamp keyed data to UTC
+
+    :param data: dict of {ISO 8601 timestamp: value}
+    :param default_zone: zone of timestamps without an UTC offset
+    :rtype : dict
+    '''
+    timestamps = list(data)
+    return dict(zip(normalize_timestamps(timestamps, default_zone), [data[timestamp] for timestamp in timestamps]))
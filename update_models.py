@@ -0,0 +1,75 @@
+'''
+Train incrementally trainable models further with data harvested after their last training hour, instead of
+regenerating them from the full history with generate_models.py
+'''
+import argparse
+import logging
+
+import numpy as np
+
+from apiharvester import APIHarvester
+from datastore import JsonLogStore
+from features import FeatureStore, TEST_YEARS, STRIKE_DATES
+from timeindex import TimeIndex, epoch_hours, year_mask, date_mask
+from timezones import HOUR, format_utc
+import models
+
+incremental_models = [model for model in models.prediction_models if model.incremental]
+
+parser = argparse.ArgumentParser(description='Update models incrementally with new data')
+parser.add_argument('-m', '--model', help='Model to update, may be given multiple times. Defaults to all incrementally '
+                                          'trainable models', dest='models', action='append',
+                    choices=[model.name for model in incremental_models])
+parser.add_argument('--test-years', help='Held-out years that are not trained, defaults to %s' % ', '.join(TEST_YEARS),
+                    dest='test_years', nargs='+', default=TEST_YEARS)
+parser.add_argument('--since', help='Train models with unknown last training hour with data after this ISO 8601 time')
+args = parser.parse_args()
+
+if args.models:
+    incremental_models = [model for model in incremental_models if model.name in args.models]
+
+harvester = APIHarvester()
+
+state_store = JsonLogStore(models.ONLINE_STATE_FILE)
+trained_until = dict(state_store.read())
+if args.since:
+    for model in incremental_models:
+        trained_until.setdefault(model.name, args.since)
+
+incremental_models = [model for model in incremental_models if model.name in trained_until]
+if not incremental_models:
+    parser.exit(message='No models with a known last training hour, use --since\n')
+
+# Join only data after the earliest last training hour
+first_hour = min(epoch_hours([trained_until[model.name] for model in incremental_models])) + 1
+
+fmi_data = harvester.read_fmi_datafile() or {}
+hsl_data = harvester.read_hsl_datafile() or {}
+
+new_data = []
+for data in [fmi_data, hsl_data]:
+    index = TimeIndex(data)
+    new_data.append(dict((key, data[key]) for key in index.keys[index.slice(first_hour, np.inf)]))
+
+features = FeatureStore.from_data(*new_data)
+hours = features.times.astype(np.int64)
+
+# New hours are trainable, except held-out test years and strikes
+train_mask = ~year_mask(hours, args.test_years) & ~date_mask(hours, STRIKE_DATES)
+
+for model in incremental_models:
+    new = train_mask & (hours > epoch_hours([trained_until[model.name]])[0])
+    if not new.any():
+        logging.info('No new data for model %s' % model.name)
+        continue
+
+    model.load_model(mmap_mode=None)
+    if model.model is None:
+        print 'Model %s is not generated yet, run generate_models.py first' % model.name
+        continue
+
+    model.update_model(features.x(model.parameters)[new], features.y()[new])
+    model.save_model()
+    state_store.upsert({model.name: format_utc([hours[new].max() * HOUR])[0]})
+
+    print 'Updated model %s with %s hours of data' % (model.name, new.sum())
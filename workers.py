@@ -0,0 +1,32 @@
+"""Process pools whose workers share state, such as training data, given once when the pool starts
+
+Usage:
+
+    import workers
+
+    def _task(row):
+        return workers.state['x'][row].sum()
+
+    pool = workers.pool(4, x=x)
+    print pool.map(_task, range(len(x)))
+"""
+
+from multiprocessing import Pool
+
+# State of a worker process, set when the worker starts
+state = {}
+
+
+def _init_worker(values):
+    state.update(values)
+
+
+def pool(processes=None, **values):
+    '''
+    Process pool whose workers find the keyword arguments in workers.state. The values are passed to each worker once
+    at start instead of with every task.
+
+    :param processes: amount of worker processes, defaults to CPU count
+    :rtype : multiprocessing.pool.Pool
+    '''
+    return Pool(processes, _init_worker, (values,))